@@ -1,9 +1,10 @@
+from typing import Optional
 from flask import Flask, jsonify
 from flask_cors import CORS
 
 from app.utils.security import init_jwt
 from .config import Config
-from .utils.security import init_jwt
+from .utils.security import PasswordHasherBusy, init_jwt
 from .extensions import db, migrate, mail, jwt
 from .api.health import bp as health_bp
 from .api.v1.auth import bp as auth_bp
@@ -11,12 +12,15 @@ from .api.v1.password import bp as password_bp
 from .scheduler import start_scheduler
 from .api.v1.quiz import bp as quiz_bp
 from .api.v1.leaderboard import bp as lead_bp
+from .cli import register_cli
 from marshmallow import ValidationError
 
 
-def create_app():
+def create_app(overrides: Optional[dict] = None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if overrides:
+        app.config.update(overrides)
 
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
@@ -31,12 +35,20 @@ def create_app():
     app.register_blueprint(password_bp)
     app.register_blueprint(quiz_bp)
     app.register_blueprint(lead_bp)
+    register_cli(app)
 
-    aps = start_scheduler(app)
-    app.extensions["scheduler"] = aps
+    if app.config.get("SCHEDULER_ENABLED", True):
+        aps = start_scheduler(app)
+        app.extensions["scheduler"] = aps
     
     @app.errorhandler(ValidationError)
     def handle_validation(err):
         return jsonify({"ok": False, "error": {"message": "Validation error", "details": err.messages}}), 400
+
+    @app.errorhandler(PasswordHasherBusy)
+    def handle_hasher_busy(err):
+        resp = jsonify({"ok": False, "error": {"message": "Server busy, retry shortly", "code": "busy"}})
+        resp.headers["Retry-After"] = "1"
+        return resp, 503
     return app
     
@@ -1,7 +1,15 @@
 from flask import Blueprint, jsonify
+from ..utils import allow_cache
+from ..utils.auth import admin_required
+from ..services import mail_outbox
 
 bp = Blueprint('health', __name__)
 
 @bp.get('/api/health')
 def health_check():
-    return jsonify({"status": "ok"}), 200
\ No newline at end of file
+    return jsonify({"status": "ok"}), 200
+
+@bp.get('/api/health/metrics')
+@admin_required
+def metrics():
+    return jsonify({"access_allow_cache": allow_cache.stats(), "mail_outbox": mail_outbox.depth()}), 200
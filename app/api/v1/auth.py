@@ -5,17 +5,19 @@ from flask_jwt_extended import create_access_token, create_refresh_token, jwt_re
 from flask_jwt_extended.utils import decode_token  # <— prefer this import
 from sqlalchemy import or_, func
 from datetime import datetime, timezone
-from ...extensions import db, jwt
+from ...extensions import db, jwt, redis_client
 from ...models import User, RefreshToken
-from ...utils.security import hash_password, check_password, hash_refresh_token
+from ...utils.security import PasswordHasherBusy, hash_password, check_password, hash_refresh_token
 from marshmallow import ValidationError
 from ...schemas.auth import RegisterSchema, LoginSchema, ChangePasswordSchema, TokensResponseSchema, MessageSchema
 from ...services.token_service import (
     mint_access_and_allow, revoke_access_token, revoke_all_for_user, revoke_refresh_by_raw, user_has_active_refresh_token, issue_refresh_token, get_refresh_by_jti,
-    delete_refresh_by_jti, delete_all_for_user
+    delete_refresh_by_jti, delete_all_for_user, rotate_refresh_token
 )
+from ...services.quiz_service import get_join_status
 from ...services.auth_service import authenticate, change_password, is_email_banned, is_username_taken, is_email_taken, create_user
 from ...utils.schema_decorators import use_schema
+from ...utils.rate_limit import rate_limit
 
 
 bp = Blueprint('auth', __name__, url_prefix="/api/v1/auth")
@@ -27,11 +29,11 @@ user_repo = UserRepo()
 def api_get_join_status():
 
     user_id = get_jwt_identity()
-    user = user_repo.get_user_by_id(user_id)
-    return jsonify(user.join_status, 200)
+    return jsonify(get_join_status(int(user_id)), 200)
 
 
 @bp.post('/register')
+@rate_limit("register", ip=(10, 3600), field=("email", 3, 3600))
 @use_schema(RegisterSchema, arg_name="payload")
 def api_register(payload):
     username = payload['username'].strip()
@@ -49,11 +51,15 @@ def api_register(payload):
         create_user(username=username, email=email, password=password)
         db.session.commit()
         return MessageSchema().dump({"msg": 'You have successfully registered!'}), 201
+    except PasswordHasherBusy:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify(error="Registration failed."), 400
     
 @bp.post('/login')
+@rate_limit("login", ip=(30, 60), field=("username", 10, 300))
 @use_schema(LoginSchema, arg_name="payload")
 def api_login(payload):
     device = request.headers.get("User-Device", "unknown")
@@ -61,15 +67,20 @@ def api_login(payload):
     user = authenticate(payload["username"].strip(), payload["password"])
     if not user:
         return jsonify(error = 'Invalid credentials. Please try again.'),401
-    access = mint_access_and_allow(identity=user.id, fresh=True)
+    # allowlist + refresh liveness go to redis in one round trip, after the commit
+    pipe = redis_client.pipeline(transaction=False)
+    access = mint_access_and_allow(identity=user.id, is_admin=user.is_admin, fresh=True, pipe=pipe)
     if not user_has_active_refresh_token(user.id):
         try:
-            refresh, _row = issue_refresh_token(user.id, device)
+            refresh, _row = issue_refresh_token(user.id, device, pipe=pipe)
             db.session.commit()
+            pipe.execute()
             return TokensResponseSchema().dump({"access_token": access, "refresh_token": refresh}), 200
         except Exception:
             db.session.rollback()
             return jsonify(error= "Could not issue refresh token."), 500
+    db.session.commit()     # persists a rehash done by authenticate
+    pipe.execute()
     return TokensResponseSchema().dump({"access_token":access}), 200
 
 @bp.post('/change_password')
@@ -90,6 +101,9 @@ def api_change_password(payload):
     except ValueError as e:
         db.session.rollback()
         return jsonify(error=str(e)), 400
+    except PasswordHasherBusy:
+        db.session.rollback()
+        raise
     except Exception:
         db.session.rollback()
         return jsonify(error="Password change failed"), 500
@@ -115,31 +129,21 @@ def api_logout():
 @jwt_required(refresh=True)
 def api_refresh_token():
     claims = get_jwt()
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     old_jti = claims["jti"]
 
-    row = get_refresh_by_jti(old_jti)
-    if not row or row.user_id != user_id or (row.expires_at < datetime.now(timezone.utc)):
-        return jsonify(error='Invalid or revoked refresh token!'), 401
- 
     try:
-        #revoke_refresh_by_raw(request.headers.get("Authorization", "").replace("Bearer ", "").strip() or "", expected_user_id=user_id)
-
         device = request.headers.get("User-Device", "unknown")
+        pipe = redis_client.pipeline(transaction=False)
+        rotated = rotate_refresh_token(old_jti, user_id, device, pipe=pipe)
+        if rotated is None:
+            db.session.rollback()
+            return jsonify(error='Invalid or revoked refresh token!'), 401
+        new_refresh, is_admin = rotated
 
-        new_access = mint_access_and_allow(identity=user_id, fresh=False)
-        new_refresh = create_refresh_token(identity=user_id, additional_claims = {"device": device})
-        dt = decode_token(new_refresh)
-        new_jti = dt["jti"]
-        new_exp = datetime.fromtimestamp(dt["exp"], tz = timezone.utc)
-        #new_refresh, _row = issue_refresh_token(user_id, device)
-        row.jti = new_jti                       
-        row.token_hash = hash_refresh_token(new_refresh)  
-        row.expires_at = new_exp
-        row.device = device
-        row.created_at = datetime.now(timezone.utc)
-        row.revoked_at = None
+        new_access = mint_access_and_allow(identity=user_id, is_admin=is_admin, fresh=False, pipe=pipe)
         db.session.commit()
+        pipe.execute()
         return TokensResponseSchema().dump({"access_token": new_access, "refresh_token": new_refresh}), 200
     except ValueError as e:
         db.session.rollback()
@@ -147,4 +151,3 @@ def api_refresh_token():
     except Exception:
         db.session.rollback()
         return jsonify(error="Could not rotate refrseh token"), 500
-    
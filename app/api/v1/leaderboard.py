@@ -1,14 +1,45 @@
 from __future__ import annotations
+import hashlib
 from datetime import datetime, date, timezone
 from functools import wraps
-from flask import Blueprint, jsonify, request
-from app.services.leaderboard_service import get_all_time_leaderboard, get_quiz_leaderboard, get_week_leaderboard
+from flask import Blueprint, jsonify, make_response, request
+from app.services.leaderboard_service import (
+    get_all_time_leaderboard, get_quiz_leaderboard, quiz_leaderboard_version, week_quiz_id
+)
+from app.utils.cursor import decode_cursor
 from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request, get_jwt
 from ...models import Quiz, QuizQuestion
+from ...extensions import db
 from sqlalchemy.orm import selectinload
 
 bp = Blueprint("leaderboard", __name__, url_prefix="/api/v1")
 
+def _frozen_cache_control(user_id) -> str:
+    # moderation and rescores rewrite frozen boards (and their freeze time), so caches revalidate every
+    # time; an unchanged board costs a 304 without running the query
+    return "public, no-cache" if user_id is None else "private, no-cache"
+
+def _quiz_board_response(quiz_id: int, user_id, limit: int, offset: int, after):
+    # closed quizzes are served from the frozen snapshot once the close job wrote it; its freeze time keys the ETag
+    frozen_at = quiz_leaderboard_version(quiz_id)
+
+    etag = None
+    if frozen_at is not None:
+        raw = f"{quiz_id}:{frozen_at.isoformat()}:{user_id}:{request.query_string.decode()}"
+        etag = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            resp = make_response("", 304)
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = _frozen_cache_control(user_id)
+            return resp
+
+    data = get_quiz_leaderboard(quiz_id=quiz_id, limit=limit, offset=offset, user_id=user_id, after=after)
+    resp = jsonify(data)
+    if etag is not None:
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = _frozen_cache_control(user_id)
+    return resp
+
 @bp.get("/<int:quiz_id>/leaderboard")
 @jwt_required(optional=True)
 def api_quiz_leaderboard(quiz_id:int):
@@ -18,16 +49,15 @@ def api_quiz_leaderboard(quiz_id:int):
         offset = int(request.args.get("offset", 0))
     except Exception:
         return jsonify(error="limit/offset must be integers"), 400
+    try:
+        after = decode_cursor(request.args.get("after"), 5)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
     try:
-        data=get_quiz_leaderboard(
-            quiz_id=quiz_id,
-            limit=limit,
-            offset=offset,
-            user_id=int(user_id)
-        )
-        return jsonify(data), 200
+        return _quiz_board_response(quiz_id, int(user_id) if user_id is not None else None, limit, offset, after)
     except ValueError as e:
+        db.session.rollback()
         return jsonify(error=str(e)), 404
 
 @bp.get("/leaderboard/week/<week_start_date>")
@@ -44,16 +74,17 @@ def api_week_leaderboard(week_start_date: str):
         offset = int(request.args.get("offset", 0))
     except Exception:
         return jsonify(error="limit/offset must be integers"), 400
+    try:
+        after = decode_cursor(request.args.get("after"), 5)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
     try:
-        data = get_week_leaderboard(
-            week_start=week_start,
-            limit=limit,
-            offset=offset,
-            user_id=int(user_id) if user_id is not None else None
+        return _quiz_board_response(
+            week_quiz_id(week_start), int(user_id) if user_id is not None else None, limit, offset, after
         )
-        return jsonify(data), 200
     except ValueError as e:
+        db.session.rollback()
         return jsonify(error=str(e)), 404
     
 @bp.get("/leaderboard/all_time")
@@ -66,9 +97,13 @@ def api_all_time_leaderboard():
     except Exception:
         return jsonify(error="linit/offset must be integers"), 400
     
-    data = get_all_time_leaderboard(
-        limit=limit,
-        offset=offset,
-        user_id=int(user_id) if user_id is not None else None
-    )
+    try:
+        data = get_all_time_leaderboard(
+            limit=limit,
+            offset=offset,
+            user_id=int(user_id) if user_id is not None else None,
+            after=decode_cursor(request.args.get("after"), 5)
+        )
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     return jsonify(data), 200
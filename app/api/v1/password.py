@@ -1,15 +1,16 @@
 from flask import Blueprint, request, jsonify, current_app
-from flask_mail import Message
 from itsdangerous import BadSignature, SignatureExpired
 
 from app.repos.user_repo import UserRepo
 from app.services.token_service import revoke_all_for_user
+from app.services import mail_outbox
 from app.utils.schema_decorators import use_schema
+from app.utils.rate_limit import rate_limit
 from werkzeug.security import generate_password_hash, check_password_hash
 import random
-from ...extensions import db, mail, redis_client
+from ...extensions import db, redis_client
 from ...models import User
-from ...utils.security import hash_password
+from ...utils.security import PasswordHasherBusy, hash_password
 from ...utils.tokens import password_reset_serializer, password_reset_salt
 from ...schemas.auth import ForgotPasswordSchema, ResetPasswordSchema, MessageSchema
 
@@ -21,6 +22,7 @@ bp = Blueprint('password', __name__, url_prefix="/api/v1/password")
 RESET_TTL_SECONDS = 3600
 
 @bp.post('/forgot_password')
+@rate_limit("forgot_password", ip=(10, 3600), field=("email", 3, 900))
 @use_schema(ForgotPasswordSchema, arg_name="payload")
 def api_forgot_password(payload):
     email = payload["email"].strip().lower()
@@ -37,12 +39,12 @@ def api_forgot_password(payload):
         redis_client.delete(attm_key) 
 
         try:
-
-            msg = Message('Password Reset Request', recipients=[email])
-            msg.body = f"Use this 6 digit code within 1 hour to reset your password:\n\n{digit_code}\n"
-            mail.send(msg)
+            mail_outbox.enqueue(
+                'Password Reset Request', [email],
+                f"Use this 6 digit code within 1 hour to reset your password:\n\n{digit_code}\n",
+            )
         except Exception as e:
-            current_app.logger.error(f"Failed to send email: {e}")        
+            current_app.logger.error(f"Failed to queue email: {e}")
         if current_app.config.get('ENV') != "production":
             return jsonify(msg='Email was sent for reset password', digit_code=digit_code), 200
         
@@ -94,6 +96,9 @@ def api_reset_password(payload):
         redis_client.delete(attm_key)
 
         return MessageSchema().dump({"msg": "Password has been reset successfully!"}), 200
+    except PasswordHasherBusy:
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify(error="Password reset failed"), 500
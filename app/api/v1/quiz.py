@@ -1,19 +1,23 @@
+from datetime import datetime, timezone
 from flask import Blueprint, jsonify, request, current_app
-from app.repos.submission_repo import SubmissionRepo
-from app.services.leaderboard_service import list_past_quizzes_with_my_placement
+from app.services.leaderboard_service import list_past_quizzes_with_my_placement, rebuild_quiz_leaderboard
 from app.utils.schema_decorators import use_schema
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.orm import selectinload
 from ...models import Quiz, QuizQuestion
+from ...services import answer_matrix
 from ...services.quiz_service import (
-    add_question, ban_user, create_quiz, add_questions, delete_question, edit_quiz, get_answer_count, get_my_answers, get_question_for_user, get_total_user_for_quiz, publish_quiz, finish_quiz,
-    join_quiz, save_answer, submit_quiz, get_active_quiz, warn_user, get_quiz_for_admin, get_quiz_for_user
+    add_question, ban_user, create_quiz, add_questions, delete_question, edit_quiz, get_answer_count, get_current_answers, get_my_answers, get_question_for_user, get_total_user_for_quiz, publish_quiz, finish_quiz,
+    join_quiz, rescore_quiz, save_answer, save_answers, submit_quiz, get_active_quiz_paper, warn_user, get_quiz_for_admin, get_quiz_for_user,
+    VersionConflict
 )
-from ...schemas.quiz import AnswerSchema, QuizCreateSchema, QuizPaperPublicSchema,  QuestionSchema
+from ...schemas.quiz import AnswerSchema, BatchAnswerSchema, QuizCreateSchema, QuestionSchema, RescoreSchema
 from ...utils.auth import admin_required
+from ...utils.cursor import decode_cursor
+from ...utils.idempotency import idempotent
 from ...utils.responses import success, fail
 from ...extensions import db
-from app.scheduler import reset_join_status_now, schedule_quiz_close_reset, start_scheduler
+from app.scheduler import schedule_quiz_close, start_scheduler
 from apscheduler.schedulers.background import BackgroundScheduler
 
 
@@ -22,11 +26,10 @@ bp = Blueprint("quiz", __name__, url_prefix="/api/v1/quiz")
 
 @bp.get("")
 def api_active_quiz():
-    q = get_active_quiz()
-    if not q:
+    data = get_active_quiz_paper()
+    if not data:
         return success({"active": False})
-    data = QuizPaperPublicSchema().dump(q)
-    total = get_total_user_for_quiz(q.id)
+    total = get_total_user_for_quiz(data["id"])
     return success({"active":True, "quiz": data, "total_participants": total})
 
 @bp.post("create")
@@ -61,7 +64,7 @@ def api_create_quiz(payload):
 
     closes_at = closes_at.astimezone(timezone.utc)
 
-    schedule_quiz_close_reset(aps, app, quiz.id, closes_at)
+    schedule_quiz_close(aps, app, quiz.id, closes_at)
 
     return success({"quiz_id": quiz.id}, 201)
 
@@ -84,12 +87,35 @@ def api_finish_quiz(quiz_id:int):
         finish_quiz(quiz_id)
         db.session.commit()
         scheduler = current_app.extensions["scheduler"]
-        reset_join_status_now(current_app, scheduler, quiz_id)
+        schedule_quiz_close(scheduler, current_app._get_current_object(), quiz_id, datetime.now(timezone.utc))
         return success()
     except ValueError as e:
         db.session.rollback()
         return fail(e, 400)
     
+@bp.post("/<int:quiz_id>/rescore")
+@admin_required
+@use_schema(RescoreSchema, arg_name="payload")
+def api_rescore_quiz(quiz_id:int, payload):
+    try:
+        result = rescore_quiz(quiz_id, payload["corrections"])
+        db.session.commit()
+        rebuild_quiz_leaderboard(quiz_id)
+        return success(result)
+    except ValueError as e:
+        db.session.rollback()
+        return fail(e, 400)
+    
+@bp.get("/<int:quiz_id>/analytics")
+@admin_required
+def api_quiz_analytics(quiz_id:int):
+    try:
+        return success(answer_matrix.cached_report(quiz_id))
+    except ValueError as e:
+        return fail(e, 404)
+    finally:
+        db.session.rollback()
+
 @bp.patch("/<int:quiz_id>/join")
 @jwt_required()
 def api_join_quiz(quiz_id:int):
@@ -104,6 +130,7 @@ def api_join_quiz(quiz_id:int):
 
 @bp.post("/<int:quiz_id>/submit")
 @jwt_required()
+@idempotent
 def api_submit_quiz(quiz_id:int):
     user_id = int(get_jwt_identity())
     
@@ -118,8 +145,14 @@ def api_submit_quiz(quiz_id:int):
     
 
 
+def _version_conflict(e: VersionConflict):
+    body, status = fail(e, 409, code="version_conflict")
+    body["error"]["current_version"] = e.current_version
+    return body, status
+
 @bp.post("/<int:quiz_id>/answers/<int:question_id>")
 @jwt_required()
+@idempotent
 @use_schema(AnswerSchema, arg_name="payload")
 def api_save_answer(quiz_id:int, question_id:int, payload):
     user_id = int(get_jwt_identity())
@@ -129,22 +162,40 @@ def api_save_answer(quiz_id:int, question_id:int, payload):
         option_id = None
     try:
         result = save_answer(quiz_id=quiz_id, user_id=user_id,
-                             question_id=question_id, option_id=option_id)
+                             question_id=question_id, option_id=option_id, version=payload["version"])
         db.session.commit()
         return success(result)
+    except VersionConflict as e:
+        db.session.rollback()
+        return _version_conflict(e)
     except ValueError as e:
         db.session.rollback()
         return fail(e, 400)
     
+@bp.post("/<int:quiz_id>/answers")
+@jwt_required()
+@idempotent
+@use_schema(BatchAnswerSchema, arg_name="payload")
+def api_save_answers(quiz_id:int, payload):
+    user_id = int(get_jwt_identity())
+    try:
+        result = save_answers(quiz_id=quiz_id, user_id=user_id, items=payload["answers"], version=payload["version"])
+        db.session.commit()
+        return success(result)
+    except VersionConflict as e:
+        db.session.rollback()
+        return _version_conflict(e)
+    except ValueError as e:
+        db.session.rollback()
+        return fail(e, 400)
+
 @bp.get("/<int:quiz_id>/get_count")
 @jwt_required()
 def api_get_answer_count(quiz_id:int):
-    submission_repo = SubmissionRepo()
     user_id = get_jwt_identity()
-    sub = submission_repo.get_for_user(quiz_id,user_id)
-    if not sub:
+    answers = get_current_answers(quiz_id, user_id)
+    if answers is None:
         return fail("No submission found", 404)
-    answers = sub.answers or {}
     return success(get_answer_count(quiz_id, answers))
 
 
@@ -212,11 +263,15 @@ def api_list_past_quizzes():
     except Exception:
         return jsonify(error="limit/offset must be integers"), 400
 
-    data = list_past_quizzes_with_my_placement(
-        user_id=int(user_id) if user_id is not None else None,
-        limit=limit,
-        offset=offset
-    )
+    try:
+        data = list_past_quizzes_with_my_placement(
+            user_id=int(user_id) if user_id is not None else None,
+            limit=limit,
+            offset=offset,
+            after=decode_cursor(request.args.get("after"), 2)
+        )
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     return jsonify(data), 200
 
 @bp.get("/<int:quiz_id>/my-answers")
@@ -0,0 +1,285 @@
+import statistics, time, uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from sqlalchemy import event, select, text
+from .extensions import db, redis_client
+from .models import QuizSubmission, RefreshToken, User
+from .repos.leaderboard_repo import LeaderboardRepo
+from .repos.quiz_repo import QuizRepo
+from .services.answer_key import AnswerKey
+from .services.answer_matrix import UNANSWERED, answer_points, key_vectors, load_matrix, question_stats, score_matrix
+from .services.leaderboard_service import rebuild_quiz_leaderboard
+from .services.token_service import issue_refresh_token, mint_access_and_allow, rotate_refresh_token
+from .utils.security import hash_refresh_token
+
+leaderboard_cli = AppGroup("leaderboard", help="Leaderboard maintenance commands.")
+bench_cli = AppGroup("bench", help="Benchmarks on a seeded dataset; every write is rolled back.")
+
+@leaderboard_cli.command("rebuild")
+@click.argument("quiz_id", type=int)
+def rebuild_leaderboard_command(quiz_id: int):
+    """Reload the live (redis) leaderboard of QUIZ_ID from Postgres."""
+    written = rebuild_quiz_leaderboard(quiz_id)
+    click.echo(f"quiz {quiz_id}: {written} leaderboard entries loaded")
+
+def _median_ms(fn, repeat: int):
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+def _seed_bench_quiz(submissions: int) -> int:
+    tag = uuid.uuid4().hex[:8]
+    quiz_id = db.session.execute(text("""
+        INSERT INTO quizzes (week_start_date, title, opens_at, closes_at, published_at)
+        SELECT COALESCE(max(week_start_date), current_date) + 7000, 'bench', now() - interval '1 day', now(), now()
+        FROM quizzes
+        RETURNING id
+    """)).scalar()
+    db.session.execute(text("""
+        WITH u AS (
+            INSERT INTO users (username, password, email, points, created_at)
+            SELECT 'bench_' || :tag || '_' || g, 'x', 'bench_' || :tag || '_' || g || '@bench.invalid',
+                   (random() * 5000)::int, now() - g * interval '1 second'
+            FROM generate_series(1, :n) g
+            RETURNING id
+        )
+        INSERT INTO quiz_submission (quiz_id, user_id, answers, score, partial_score, answered_count, submitted_at)
+        SELECT :quiz_id, u.id, '{}'::jsonb, (random() * 200)::int, 0, 0, now() - random() * interval '1 day'
+        FROM u
+    """), {"tag": tag, "n": submissions, "quiz_id": quiz_id})
+    db.session.execute(text("ANALYZE users"))
+    db.session.execute(text("ANALYZE quiz_submission"))
+    return quiz_id
+
+_QUIZ_WINDOW_RANK = text("""
+    SELECT rank FROM (
+        SELECT s.user_id, dense_rank() OVER (ORDER BY s.score DESC, s.submitted_at ASC) AS rank
+        FROM quiz_submission s JOIN users u ON u.id = s.user_id
+        WHERE s.quiz_id = :quiz_id AND s.submitted_at IS NOT NULL
+          AND (s.user_status IS NULL OR s.user_status NOT IN ('warned', 'banned'))
+          AND NOT (u.timeout AND u.timeout_until IS NULL)
+    ) r WHERE r.user_id = :user_id
+""")
+
+_ALL_TIME_WINDOW_RANK = text("""
+    SELECT rank FROM (
+        SELECT id, dense_rank() OVER (ORDER BY points DESC, created_at ASC) AS rank
+        FROM users WHERE points > 0
+    ) r WHERE r.id = :user_id
+""")
+
+@bench_cli.command("rank")
+@click.option("--submissions", default=2_000_000, show_default=True)
+@click.option("--repeat", default=5, show_default=True)
+def bench_rank_command(submissions: int, repeat: int):
+    """Full dense_rank() window vs the strictly-better count for the current user's rank."""
+    repo = LeaderboardRepo()
+    try:
+        started = time.perf_counter()
+        quiz_id = _seed_bench_quiz(submissions)
+        click.echo(f"seeded {submissions} submissions in {time.perf_counter() - started:.1f}s")
+
+        for label, offset in (("top", 0), ("middle", submissions // 2), ("bottom", submissions - 1)):
+            user_id = db.session.execute(text("""
+                SELECT user_id FROM quiz_submission
+                WHERE quiz_id = :quiz_id ORDER BY score DESC, submitted_at ASC LIMIT 1 OFFSET :offset
+            """), {"quiz_id": quiz_id, "offset": offset}).scalar()
+
+            window_ms, window_rank = _median_ms(
+                lambda: db.session.execute(_QUIZ_WINDOW_RANK, {"quiz_id": quiz_id, "user_id": user_id}).scalar(),
+                repeat)
+            lookup_ms, row = _median_ms(lambda: repo.quiz_current_user_row(quiz_id, user_id), repeat)
+            click.echo(f"quiz     {label:<6} window {window_ms:9.2f} ms (rank {window_rank})"
+                       f" | lookup {lookup_ms:9.2f} ms (rank {row.rank})")
+
+            all_window_ms, all_window_rank = _median_ms(
+                lambda: db.session.execute(_ALL_TIME_WINDOW_RANK, {"user_id": user_id}).scalar(), repeat)
+            all_lookup_ms, all_row = _median_ms(lambda: repo.all_time_current_user_row(user_id), repeat)
+            click.echo(f"all-time {label:<6} window {all_window_ms:9.2f} ms (rank {all_window_rank})"
+                       f" | lookup {all_lookup_ms:9.2f} ms (rank {all_row.rank})")
+    finally:
+        db.session.rollback()
+
+@contextmanager
+def _count_queries():
+    counter = {"queries": 0}
+    def _on_execute(*_args, **_kwargs):
+        counter["queries"] += 1
+    event.listen(db.engine, "before_cursor_execute", _on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _on_execute)
+
+def _per_call(fn, repeat: int):
+    """Run fn() `repeat` times; returns (median wall ms, median cpu ms, queries per call)."""
+    wall, cpu = [], []
+    with _count_queries() as counter:
+        for _ in range(repeat):
+            db.session.expunge_all()    # every request starts with an empty identity map
+            w, c = time.perf_counter(), time.process_time()
+            fn()
+            wall.append((time.perf_counter() - w) * 1000)
+            cpu.append((time.process_time() - c) * 1000)
+    return statistics.median(wall), statistics.median(cpu), counter["queries"] / repeat
+
+def _legacy_mint(user_id: int) -> str:
+    # the previous mint: load the user for is_admin, let flask-jwt-extended pick jti/exp, decode them back
+    user = db.session.get(User, user_id)
+    token = create_access_token(identity=user_id, additional_claims={"is_admin": bool(user.is_admin)})
+    decoded = decode_token(token)
+    redis_client.setex(f"acc:allow:{decoded['jti']}", max(int(decoded["exp"] - time.time()), 1), user_id)
+    return token
+
+@bench_cli.command("mint")
+@click.option("--repeat", default=500, show_default=True)
+def bench_mint_command(repeat: int):
+    """Access-token minting and refresh rotation, previous flow vs current, per call."""
+    try:
+        user_id = db.session.execute(text("""
+            INSERT INTO users (username, password, email)
+            VALUES ('bench_' || :tag, 'x', 'bench_' || :tag || '@bench.invalid')
+            RETURNING id
+        """), {"tag": uuid.uuid4().hex[:8]}).scalar()
+
+        def new_mint():
+            pipe = redis_client.pipeline(transaction=False)
+            mint_access_and_allow(user_id, is_admin=False, pipe=pipe)
+            pipe.execute()
+
+        for label, fn in (("mint   previous", lambda: _legacy_mint(user_id)), ("mint   current ", new_mint)):
+            wall, cpu, queries = _per_call(fn, repeat)
+            click.echo(f"{label} {wall:7.3f} ms wall {cpu:7.3f} ms cpu {queries:4.1f} queries/call")
+
+        _token, row = issue_refresh_token(user_id, "bench", pipe=redis_client.pipeline())
+        state = {"jti": row.jti, "token": None}
+        db.session.flush()
+
+        def legacy_refresh():
+            row = db.session.get(RefreshToken, state["jti"])
+            _legacy_mint(user_id)
+            token = create_refresh_token(identity=user_id)
+            decoded = decode_token(token)
+            row.jti = decoded["jti"]
+            row.token_hash = hash_refresh_token(token)
+            row.expires_at = datetime.fromtimestamp(decoded["exp"], tz=timezone.utc)
+            row.revoked_at = None
+            db.session.flush()
+            state["jti"] = decoded["jti"]
+
+        def new_refresh():
+            pipe = redis_client.pipeline(transaction=False)
+            token, is_admin = rotate_refresh_token(state["jti"], user_id, "bench", pipe=pipe)
+            mint_access_and_allow(user_id, is_admin=is_admin, pipe=pipe)
+            pipe.execute()
+            state["token"] = token
+
+        wall, cpu, queries = _per_call(legacy_refresh, repeat)
+        click.echo(f"refresh previous {wall:7.3f} ms wall {cpu:7.3f} ms cpu {queries:4.1f} queries/call")
+        # the rotated jti is read back outside the timed call
+        timed = []
+        with _count_queries() as counter:
+            for _ in range(repeat):
+                w, c = time.perf_counter(), time.process_time()
+                new_refresh()
+                timed.append(((time.perf_counter() - w) * 1000, (time.process_time() - c) * 1000))
+                state["jti"] = decode_token(state["token"])["jti"]
+        click.echo(f"refresh current  {statistics.median(t[0] for t in timed):7.3f} ms wall"
+                   f" {statistics.median(t[1] for t in timed):7.3f} ms cpu"
+                   f" {counter['queries'] / repeat:4.1f} queries/call")
+    finally:
+        db.session.rollback()
+
+def _seed_bench_answers(quiz_id: int, questions: int) -> None:
+    """Give the bench quiz `questions` questions of 4 options and fill every submission with random picks."""
+    db.session.execute(text("""
+        WITH q AS (
+            INSERT INTO quiz_questions (quiz_id, "order", text, difficulty)
+            SELECT :quiz_id, g, 'bench ' || g, (ARRAY['easy', 'medium', 'hard'])[1 + g % 3]::difficulty
+            FROM generate_series(1, :questions) g
+            RETURNING id
+        )
+        INSERT INTO quiz_options (question_id, text, is_correct)
+        SELECT q.id, 'option ' || k, k = 1 + q.id % 4
+        FROM q CROSS JOIN generate_series(1, 4) k
+    """), {"quiz_id": quiz_id, "questions": questions})
+    # about one answer in ten is left blank
+    db.session.execute(text("""
+        WITH opts AS (
+            SELECT o.question_id, array_agg(o.id ORDER BY o.id) AS ids
+            FROM quiz_options o JOIN quiz_questions q ON q.id = o.question_id
+            WHERE q.quiz_id = :quiz_id
+            GROUP BY o.question_id
+        ), picked AS (
+            SELECT s.id, jsonb_object_agg(opts.question_id::text, opts.ids[1 + floor(random() * 4)::int]) AS answers,
+                   count(*) AS answered
+            FROM quiz_submission s CROSS JOIN opts
+            WHERE s.quiz_id = :quiz_id AND random() >= 0.1
+            GROUP BY s.id
+        )
+        UPDATE quiz_submission s SET answers = picked.answers, answered_count = picked.answered
+        FROM picked WHERE s.id = picked.id
+    """), {"quiz_id": quiz_id})
+    db.session.execute(text("ANALYZE quiz_submission"))
+
+@bench_cli.command("scoring")
+@click.option("--submissions", default=1_000_000, show_default=True)
+@click.option("--questions", default=10, show_default=True)
+@click.option("--repeat", default=3, show_default=True)
+def bench_scoring_command(submissions: int, questions: int, repeat: int):
+    """Score a seeded quiz: ORM rows + AnswerKey.score per submission vs load_matrix + the vectorized score."""
+    try:
+        started = time.perf_counter()
+        quiz_id = _seed_bench_quiz(submissions)
+        _seed_bench_answers(quiz_id, questions)
+        click.echo(f"seeded {submissions} submissions x {questions} questions in {time.perf_counter() - started:.1f}s")
+
+        key = AnswerKey.from_quiz(QuizRepo().get_with_question(quiz_id))
+        question_ids = sorted(key.points)
+        vectors = key_vectors(key, question_ids)
+        chunk_size = current_app.config.get("ANALYTICS_CHUNK_SIZE", 50000)
+
+        def orm_loop():
+            # a fresh identity map each run, so every repeat really loads the rows
+            db.session.expunge_all()
+            rows = db.session.execute(
+                select(QuizSubmission)
+                .where(QuizSubmission.quiz_id == quiz_id, QuizSubmission.submitted_at.isnot(None))
+                .order_by(QuizSubmission.id)
+                .execution_options(yield_per=chunk_size)
+            ).scalars()
+            return [key.score(s.answers) for s in rows]
+
+        orm_ms, orm_scores = _median_ms(orm_loop, repeat)
+        load_ms, matrix = _median_ms(lambda: load_matrix(quiz_id, question_ids), repeat)
+        vector_ms, vector_scores = _median_ms(lambda: score_matrix(matrix, vectors), repeat)
+        stats_ms, _ = _median_ms(lambda: question_stats(matrix, answer_points(matrix, vectors)), repeat)
+
+        same = np.array_equal(np.asarray(orm_scores, dtype=np.int32), vector_scores)
+        matrix_ms = load_ms + vector_ms
+        click.echo(f"orm rows + AnswerKey.score {orm_ms:10.1f} ms")
+        click.echo(f"load_matrix + vectorized   {matrix_ms:10.1f} ms ({orm_ms / max(matrix_ms, 1e-9):.1f}x),"
+                   f" scores match: {same}")
+        click.echo(f"  load_matrix {load_ms:10.1f} ms | vectorized score {vector_ms:8.1f} ms"
+                   f" | per-question rates {stats_ms:8.1f} ms")
+
+        # scoring alone, on answers already in memory: decoded dicts vs the matrix
+        fields = [str(q) for q in question_ids]
+        dicts = [{f: o for f, o in zip(fields, row) if o != UNANSWERED} for row in matrix.answers.tolist()]
+        loop_ms, _ = _median_ms(lambda: [key.score(d) for d in dicts], repeat)
+        click.echo(f"  in memory: python loop {loop_ms:8.1f} ms | vectorized {vector_ms:8.1f} ms"
+                   f" ({loop_ms / max(vector_ms, 1e-9):.0f}x)")
+    finally:
+        db.session.rollback()
+
+def register_cli(app):
+    app.cli.add_command(leaderboard_cli)
+    app.cli.add_command(bench_cli)
@@ -22,6 +22,12 @@ class Config:
     MAIL_USERNAME=os.getenv("MAIL_USERNAME")
     MAIL_PASSWORD=os.getenv("MAIL_PASSWORD")
     MAIL_DEFAULT_SENDER=os.getenv("MAIL_DEFAULT_SENDER")
+    MAIL_SUPPRESS_SEND=_as_bool(os.getenv("MAIL_SUPPRESS_SEND", "false"))
+    MAIL_OUTBOX_SEND_SECONDS = int(os.getenv("MAIL_OUTBOX_SEND_SECONDS", "2"))
+    MAIL_OUTBOX_BATCH = int(os.getenv("MAIL_OUTBOX_BATCH", "100"))
+    MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "6"))
+    MAIL_RETRY_BASE_SECONDS = int(os.getenv("MAIL_RETRY_BASE_SECONDS", "30"))
+    MAIL_OUTBOX_LOCK_SECONDS = int(os.getenv("MAIL_OUTBOX_LOCK_SECONDS", "120"))    # sender lock TTL, renewed per message
 
     JWT_SECRET_KEY = os.getenv("SECRET_KEY")
 
@@ -31,10 +37,47 @@ class Config:
     JWT_HEADER_TYPE = os.getenv("JWT_HEADER_TYPE")
     JWT_HEADER_NAME = os.getenv("JWT_HEADER_NAME")
 
+    SCHEDULER_ENABLED = _as_bool(os.getenv("SCHEDULER_ENABLED", "true"))     # off for tests and one-off commands
     SCHEDULER_TIMEZONE = os.getenv("SCHEDULER_TIMEZONE")
     SCHEDULER_HOUR = (os.getenv("SCHEDULER_HOUR"))
     SCHEDULER_MINUTE = (os.getenv("SCHEDULER_MINUTE"))
     run_once_on_boot = _as_bool(os.getenv("SCHEDULER_RUN_ON_BOOT"))
 
     PASSWORD_RESET_SECRET =os.getenv("PASSWORD_RESET_SECRET")
-    PASSWORD_RESET_SALT = os.getenv("PASSWORD_RESET_SALT")
\ No newline at end of file
+    PASSWORD_RESET_SALT = os.getenv("PASSWORD_RESET_SALT")
+
+    QUIZ_CACHE_TTL = int(os.getenv("QUIZ_CACHE_TTL", "3600"))
+    QUIZ_CACHE_LOCAL_SIZE = int(os.getenv("QUIZ_CACHE_LOCAL_SIZE", "256"))
+
+    ANSWER_DRAFT_BUFFER = _as_bool(os.getenv("ANSWER_DRAFT_BUFFER", "false"))
+    ANSWER_DRAFT_TTL = int(os.getenv("ANSWER_DRAFT_TTL", "172800"))
+    ANSWER_DRAFT_FLUSH_SECONDS = int(os.getenv("ANSWER_DRAFT_FLUSH_SECONDS", "5"))
+    ANSWER_DRAFT_FLUSH_BATCH = int(os.getenv("ANSWER_DRAFT_FLUSH_BATCH", "500"))
+
+    PARTICIPANT_RECONCILE_SECONDS = int(os.getenv("PARTICIPANT_RECONCILE_SECONDS", "300"))
+    LIVE_LEADERBOARD_CHECK_SECONDS = int(os.getenv("LIVE_LEADERBOARD_CHECK_SECONDS", "15"))     # how soon a missing live board is rebuilt
+    LIVE_LEADERBOARD_REBUILD_LOCK_SECONDS = int(os.getenv("LIVE_LEADERBOARD_REBUILD_LOCK_SECONDS", "600"))
+    QUIZ_CLOSE_SWEEP_SECONDS = int(os.getenv("QUIZ_CLOSE_SWEEP_SECONDS", "300"))     # re-arms lost close jobs, closes missed quizzes
+
+    BATCH_MUTATION_SIZE = int(os.getenv("BATCH_MUTATION_SIZE", "5000"))
+    BATCH_MUTATION_SLEEP_MS = int(os.getenv("BATCH_MUTATION_SLEEP_MS", "50"))
+
+    ACCESS_ALLOW_CACHE = _as_bool(os.getenv("ACCESS_ALLOW_CACHE", "false"))
+    ACCESS_ALLOW_CACHE_TTL_MS = int(os.getenv("ACCESS_ALLOW_CACHE_TTL_MS", "500"))
+    ACCESS_ALLOW_CACHE_SIZE = int(os.getenv("ACCESS_ALLOW_CACHE_SIZE", "10000"))
+    # false: access tokens are checked by the per-user epoch only and no acc:allow:<jti> keys are kept
+    ACCESS_TOKEN_ALLOWLIST = _as_bool(os.getenv("ACCESS_TOKEN_ALLOWLIST", "true"))
+
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    BCRYPT_POOL_SIZE = int(os.getenv("BCRYPT_POOL_SIZE", "2"))      # 0 hashes inline in the request thread
+    BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "16"))
+
+    # token buckets on login/register/forgot_password; limits are set on each route
+    RATE_LIMIT_ENABLED = _as_bool(os.getenv("RATE_LIMIT_ENABLED", "true"))
+
+    # Idempotency-Key on submit/answer saves: how long responses are replayed, and how long the first request holds the key
+    IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "3600"))
+    IDEMPOTENCY_LOCK_MS = int(os.getenv("IDEMPOTENCY_LOCK_MS", "10000"))
+
+    ANALYTICS_CHUNK_SIZE = int(os.getenv("ANALYTICS_CHUNK_SIZE", "50000"))     # rows per server-side cursor fetch
+    ANALYTICS_LIVE_TTL = int(os.getenv("ANALYTICS_LIVE_TTL", "60"))     # seconds an open quiz's report is reused
@@ -13,11 +13,18 @@ class User(db.Model):
     created_at = db.Column(db.TIMESTAMP, server_default=db.func.now())
     points = db.Column(db.Integer, default = 0)
     role = db.Column(db.String(20), nullable=False, server_default="user")
-    join_status = db.Column(JoinStatusEnum, nullable = False, server_default="not_joined", index=True)
     user_status = db.Column(UserStatusEnum, nullable = False, server_default="normal", index=True)
     #current_quiz_id may implemented but since there is only one quiz per week i dont think its necessary
     timeout = db.Column(db.Boolean, nullable = False, server_default = "false", index=True)
     timeout_until = db.Column(db.DateTime(timezone=True), nullable= True, index=True)
+
+    __table_args__ = (
+        db.Index("ix_users_points_created_at", db.text("points DESC"), "created_at",
+                 postgresql_where=db.text("points > 0")),
+        db.Index("ix_users_points_seek", db.text("(-points)"), "created_at", "id",
+                 postgresql_where=db.text("points > 0")),
+    )
+
     @property
     def is_admin(self):
         return self.role == "admin"
@@ -40,6 +47,8 @@ class Quiz(db.Model):
     opens_at = db.Column(db.DateTime(timezone=True), nullable = False, index=True)
     closes_at = db.Column(db.DateTime(timezone=True), nullable = False, index=True)
     published_at = db.Column(db.DateTime(timezone=True))
+    # set when quiz_leaderboard_snapshot was (re)written; closed-quiz boards are served from it
+    leaderboard_frozen_at = db.Column(db.DateTime(timezone=True), nullable=True)
 
     questions = db.relationship(
         "QuizQuestion",
@@ -101,9 +110,46 @@ class QuizSubmission(db.Model):
     user_status = db.Column(UserStatusEnum, nullable=True, index=True)
     answers = db.Column(JSONB, nullable=False,server_default=db.text("'{}'::jsonb"))
     score = db.Column(db.Integer, nullable = False, server_default="0")
+    # running totals kept by save_answer so submit does not rescore every answer
+    partial_score = db.Column(db.Integer, nullable = False, server_default="0")
+    answered_count = db.Column(db.Integer, nullable = False, server_default="0")
+    # bumped by every answer write; saves are compare-and-swap on it instead of locking the row
+    version = db.Column(db.Integer, nullable = False, server_default="0")
 
     quiz = db.relationship("Quiz")
     user = db.relationship("User")
     __table_args__ = (
         db.UniqueConstraint("quiz_id", "user_id", name = "uq_one_submission_per_quiz"),
-    )
\ No newline at end of file
+        db.Index("ix_quiz_submission_rank", "quiz_id", db.text("score DESC"), "submitted_at",
+                 postgresql_where=db.text("submitted_at IS NOT NULL")),
+        db.Index("ix_quiz_submission_seek", "quiz_id", db.text("(-score)"), "submitted_at", "user_id",
+                 postgresql_where=db.text("submitted_at IS NOT NULL")),
+    )
+
+class QuizLeaderboardSnapshot(db.Model):
+    __tablename__ = "quiz_leaderboard_snapshot"
+
+    quiz_id = db.Column(db.Integer, db.ForeignKey("quizzes.id", ondelete="CASCADE"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    position = db.Column(db.Integer, nullable=False)     # 1-based row order, pages read position ranges
+    rank = db.Column(db.Integer, nullable=False)
+    username = db.Column(db.String(50), nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    submitted_at = db.Column(db.DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint("quiz_id", "position", name="uq_lb_snapshot_position"),
+    )
+
+class QuizParticipation(db.Model):
+    __tablename__ = "quiz_participation"
+
+    quiz_id = db.Column(db.Integer, db.ForeignKey("quizzes.id", ondelete="CASCADE"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # a missing row means not_joined, so a new quiz needs no reset
+    status = db.Column(JoinStatusEnum, nullable=False, server_default="joined")
+    joined_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+
+    __table_args__ = (
+        db.Index("ix_quiz_participation_status", "quiz_id", "status"),
+    )
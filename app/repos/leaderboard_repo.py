@@ -1,8 +1,8 @@
 from typing import Sequence, Tuple
-from sqlalchemy import and_, exists, func, not_
+from sqlalchemy import and_, case, distinct, exists, false, func, insert, not_, or_, select, tuple_
 from sqlalchemy.orm import aliased
 from ..extensions import db
-from ..models import Quiz, QuizSubmission, User
+from ..models import Quiz, QuizLeaderboardSnapshot, QuizSubmission, User
 
 class LeaderboardRepo:
     @staticmethod
@@ -27,6 +27,61 @@ class LeaderboardRepo:
         ))
         return not_(flagged)
     
+    @staticmethod
+    def _quiz_rank_of(quiz_id: int, score, submitted_at):
+        """dense_rank without a window: 1 + distinct strictly-better (score, submitted_at) tuples,
+        answered from ix_quiz_submission_rank."""
+        s2 = aliased(QuizSubmission)
+        u2 = aliased(User)
+        better = or_(
+            s2.score > score,
+            and_(s2.score == score, s2.submitted_at < submitted_at),
+        )
+        return (
+            select(func.count(distinct(tuple_(s2.score, s2.submitted_at))) + 1)
+            .join(u2, u2.id == s2.user_id)
+            .where(
+                s2.quiz_id == quiz_id,
+                s2.submitted_at.isnot(None),
+                or_(s2.user_status.is_(None), s2.user_status.notin_(("warned", "banned"))),
+                not_(and_(u2.timeout.is_(True), u2.timeout_until.is_(None))),
+                better,
+            )
+        )
+
+    def _quiz_rank_lookup(self, quiz_id: int):
+        return (self._quiz_rank_of(quiz_id, QuizSubmission.score, QuizSubmission.submitted_at)
+                .correlate(QuizSubmission)
+                .scalar_subquery())
+
+    @staticmethod
+    def _all_time_rank_of(points, created_at):
+        """Same idea for the all-time board, answered from ix_users_points_created_at."""
+        u2 = aliased(User)
+        better = or_(
+            u2.points > points,
+            and_(u2.points == points, u2.created_at < created_at),
+        )
+        return (
+            select(func.count(distinct(tuple_(u2.points, u2.created_at))) + 1)
+            .where(u2.points > 0, better)
+        )
+
+    def _all_time_rank_lookup(self):
+        return self._all_time_rank_of(User.points, User.created_at).correlate(User).scalar_subquery()
+
+    @staticmethod
+    def _with_dense_ranks(rows, prev_rank: int, prev_key, key) -> list:
+        # seek pages carry no window; rank on from the previous page's last (key, rank) in the cursor
+        ranked, rank, prev = [], prev_rank, prev_key
+        for r in rows:
+            k = key(r)
+            if prev is not None and k != prev:
+                rank += 1
+            ranked.append((r, rank))
+            prev = k
+        return ranked
+
     @staticmethod
     def _all_time_rank_window():
         return func.dense_rank().over(order_by=(User.points.desc(), User.created_at.asc()))
@@ -38,10 +93,11 @@ class LeaderboardRepo:
                 User.id.label("user_id"),
                 User.username.label("username"),
                 User.points.label("points"),
+                User.created_at.label("created_at"),
                 rank.label("rank"),
             )
             .filter(User.points > 0)
-            .order_by(User.points.desc(), User.created_at.asc())
+            .order_by(User.points.desc(), User.created_at.asc(), User.id.asc())
             .limit(limit)
             .offset(offset)
             .all()
@@ -50,8 +106,33 @@ class LeaderboardRepo:
         total = db.session.query(func.count(User.id).filter(User.points > 0)).scalar() or 0
         return rows, total
     
+    def all_time_rows_after(self, after, limit: int):
+        """Keyset page of the all-time board after `after` = (points, created_at, user_id, rank, total).
+
+        The row-value seek is one range scan of ix_users_points_seek; rank and total come from the
+        cursor, so a page costs the same at any depth. Returns ([(row, rank)], total).
+        """
+        points, created_at, last_id, last_rank, total = after
+        rows = (
+            db.session.query(
+                User.id.label("user_id"),
+                User.username.label("username"),
+                User.points.label("points"),
+                User.created_at.label("created_at"),
+            )
+            .filter(
+                User.points > 0,
+                tuple_(-User.points, User.created_at, User.id) > tuple_(-points, created_at, last_id),
+            )
+            .order_by(-User.points, User.created_at, User.id)
+            .limit(limit)
+            .all()
+        )
+        ranked = self._with_dense_ranks(rows, last_rank, (points, created_at), lambda r: (r.points, r.created_at))
+        return ranked, total
+
     def all_time_current_user_row(self, user_id: int):
-        rank = self._all_time_rank_window()
+        rank = self._all_time_rank_lookup()
         return (
             db.session.query(
                 User.id.label("user_id"),
@@ -81,13 +162,14 @@ class LeaderboardRepo:
             rank.label("rank"),
             )
             .join(User, User.id == QuizSubmission.user_id)
+            .join(Quiz, Quiz.id == QuizSubmission.quiz_id)
             .filter(
                 QuizSubmission.quiz_id == quiz_id,
                 QuizSubmission.submitted_at.isnot(None),
                 not_flagged,
                 not_banned_now
             )
-            .order_by(QuizSubmission.score.desc(),QuizSubmission.submitted_at.asc())
+            .order_by(QuizSubmission.score.desc(),QuizSubmission.submitted_at.asc(), QuizSubmission.user_id.asc())
             .limit(limit)
             .offset(offset)
             .all()
@@ -95,6 +177,7 @@ class LeaderboardRepo:
 
         total = (
             db.session.query(func.count(QuizSubmission.user_id))
+            .join(User, User.id == QuizSubmission.user_id)
             .filter(
                 QuizSubmission.quiz_id == quiz_id,
                 QuizSubmission.submitted_at.isnot(None),
@@ -106,8 +189,41 @@ class LeaderboardRepo:
 
         return rows, total
     
+    def quiz_leaderboard_rows_after(self, quiz_id: int, after, limit: int):
+        """Keyset page of a quiz board after `after` = (score, submitted_at, user_id, rank, total).
+
+        The row-value seek is one range scan of ix_quiz_submission_seek; rank and total come from
+        the cursor. Returns ([(row, rank)], total).
+        """
+        score, submitted_at, last_user_id, last_rank, total = after
+        rows = (
+            db.session.query(
+                QuizSubmission.quiz_id.label("quiz_id"),
+                QuizSubmission.user_id.label("user_id"),
+                User.username.label("username"),
+                QuizSubmission.score.label("score"),
+                QuizSubmission.submitted_at.label("submitted_at"),
+                Quiz.title.label("title"),
+            )
+            .join(User, User.id == QuizSubmission.user_id)
+            .join(Quiz, Quiz.id == QuizSubmission.quiz_id)
+            .filter(
+                QuizSubmission.quiz_id == quiz_id,
+                QuizSubmission.submitted_at.isnot(None),
+                self._not_flagged_for_quiz(QuizSubmission.quiz_id, QuizSubmission.user_id),
+                not_(self._is_user_currently_banned()),
+                tuple_(-QuizSubmission.score, QuizSubmission.submitted_at, QuizSubmission.user_id)
+                > tuple_(-score, submitted_at, last_user_id),
+            )
+            .order_by(-QuizSubmission.score, QuizSubmission.submitted_at, QuizSubmission.user_id)
+            .limit(limit)
+            .all()
+        )
+        ranked = self._with_dense_ranks(rows, last_rank, (score, submitted_at), lambda r: (r.score, r.submitted_at))
+        return ranked, total
+
     def quiz_current_user_row(self, quiz_id: int, user_id: int):
-        rank = self.rank_window()
+        rank = self._quiz_rank_lookup(quiz_id)
         not_flagged = self._not_flagged_for_quiz(quiz_id, QuizSubmission.user_id)
         not_banned_now = not_(self._is_user_currently_banned())
         return(
@@ -129,10 +245,151 @@ class LeaderboardRepo:
             .first()
         )
     
+    def quiz_entries(self, quiz_id: int):
+        """Every leaderboard-eligible submission of a quiz, streamed; used to (re)build the live leaderboard."""
+        not_flagged = self._not_flagged_for_quiz(QuizSubmission.quiz_id, QuizSubmission.user_id)
+        not_banned_now = not_(self._is_user_currently_banned())
+        return (
+            db.session.query(
+                QuizSubmission.user_id.label("user_id"),
+                User.username.label("username"),
+                QuizSubmission.score.label("score"),
+                QuizSubmission.submitted_at.label("submitted_at"),
+            )
+            .join(User, User.id == QuizSubmission.user_id)
+            .filter(
+                QuizSubmission.quiz_id == quiz_id,
+                QuizSubmission.submitted_at.isnot(None),
+                not_flagged,
+                not_banned_now,
+            )
+            .yield_per(5000)
+        )
+
+    def quiz_excluded_user_ids(self, quiz_id: int) -> list[int]:
+        rows = (
+            db.session.query(QuizSubmission.user_id)
+            .join(User, User.id == QuizSubmission.user_id)
+            .filter(
+                QuizSubmission.quiz_id == quiz_id,
+                or_(
+                    QuizSubmission.user_status.in_(("warned", "banned")),
+                    self._is_user_currently_banned(),
+                ),
+            )
+            .all()
+        )
+        return [r.user_id for r in rows]
+
+    def quiz_title(self, quiz_id: int):
+        return db.session.query(Quiz.title).filter(Quiz.id == quiz_id).scalar()
+
+    def snapshot_state(self, quiz_id: int):
+        return (db.session.query(Quiz.id, Quiz.title, Quiz.closes_at, Quiz.leaderboard_frozen_at)
+                .filter(Quiz.id == quiz_id)
+                .first())
+
+    def write_quiz_snapshot(self, quiz_id: int) -> int:
+        """Replace the quiz's snapshot with its current board in one INSERT ... SELECT. Returns rows written.
+
+        Serialised per quiz with a transaction-level advisory lock so concurrent freezes do not collide.
+        """
+        db.session.flush()      # moderation changes made earlier in this transaction must be visible
+        db.session.execute(select(func.pg_advisory_xact_lock(func.hashtext("quiz_leaderboard_snapshot"), quiz_id)))
+        db.session.query(QuizLeaderboardSnapshot).filter(
+            QuizLeaderboardSnapshot.quiz_id == quiz_id
+        ).delete(synchronize_session=False)
+
+        order = (QuizSubmission.score.desc(), QuizSubmission.submitted_at.asc(), QuizSubmission.user_id.asc())
+        board = (
+            select(
+                QuizSubmission.quiz_id,
+                QuizSubmission.user_id,
+                func.row_number().over(order_by=order),
+                func.dense_rank().over(order_by=order[:2]),
+                User.username,
+                QuizSubmission.score,
+                QuizSubmission.submitted_at,
+            )
+            .join(User, User.id == QuizSubmission.user_id)
+            .where(
+                QuizSubmission.quiz_id == quiz_id,
+                QuizSubmission.submitted_at.isnot(None),
+                self._not_flagged_for_quiz(QuizSubmission.quiz_id, QuizSubmission.user_id),
+                not_(self._is_user_currently_banned()),
+            )
+        )
+        written = db.session.execute(
+            insert(QuizLeaderboardSnapshot).from_select(
+                ["quiz_id", "user_id", "position", "rank", "username", "score", "submitted_at"], board
+            )
+        ).rowcount
+        db.session.query(Quiz).filter(Quiz.id == quiz_id).update(
+            {Quiz.leaderboard_frozen_at: func.clock_timestamp()}, synchronize_session=False
+        )
+        return written
+
+    def snapshot_rows(self, quiz_id: int, limit: int, offset: int) -> Tuple[Sequence, int]:
+        rows = (
+            db.session.query(QuizLeaderboardSnapshot)
+            .filter(
+                QuizLeaderboardSnapshot.quiz_id == quiz_id,
+                QuizLeaderboardSnapshot.position > offset,
+            )
+            .order_by(QuizLeaderboardSnapshot.position)
+            .limit(limit)
+            .all()
+        )
+        return rows, self.snapshot_total(quiz_id)
+
+    def snapshot_rows_after(self, quiz_id: int, after, limit: int) -> Tuple[Sequence, int]:
+        """Snapshot page after the cursor's row: a `position` range, with rank stored on each row.
+
+        `after` = (score, submitted_at, user_id, rank, total). If that user has since left the
+        snapshot (moderation rewrote it) the page starts at the first row past the cursor's key.
+        """
+        score, submitted_at, last_user_id, _rank, total = after
+        S = QuizLeaderboardSnapshot
+        position = (
+            db.session.query(S.position)
+            .filter(S.quiz_id == quiz_id, S.user_id == last_user_id)
+            .scalar()
+        )
+        if position is None:
+            position = (
+                db.session.query(func.coalesce(func.min(S.position), total + 1) - 1)
+                .filter(
+                    S.quiz_id == quiz_id,
+                    tuple_(-S.score, S.submitted_at, S.user_id) > tuple_(-score, submitted_at, last_user_id),
+                )
+                .scalar()
+            )
+        rows = (
+            db.session.query(S)
+            .filter(S.quiz_id == quiz_id, S.position > position)
+            .order_by(S.position)
+            .limit(limit)
+            .all()
+        )
+        return rows, total
+
+    def snapshot_total(self, quiz_id: int) -> int:
+        return (
+            db.session.query(func.count(QuizLeaderboardSnapshot.user_id))
+            .filter(QuizLeaderboardSnapshot.quiz_id == quiz_id)
+            .scalar() or 0
+        )
+
+    def snapshot_user_row(self, quiz_id: int, user_id: int):
+        return db.session.get(QuizLeaderboardSnapshot, (quiz_id, user_id))
+
     def past_quizzes_with_my_placement(
-            self, user_id: int, limit: int, offset: int) -> Tuple[Sequence,int]:
+            self, user_id: int, limit: int, offset: int, after=None) -> Tuple[Sequence,int]:
+        """Closed quizzes, newest first, with the caller's placement.
+
+        `after` = (week_start_date, quiz_id) switches from OFFSET to keyset paging.
+        """
         now = func.now()
-        not_banned_now = not_(self._is_user_currently_banned())
         participants_sq = (
             db.session.query(func.count(QuizSubmission.user_id))
             .filter(
@@ -141,72 +398,44 @@ class LeaderboardRepo:
             )
             .correlate(Quiz)
         )
-        if user_id is not None:
-            flagged = self._not_flagged_for_quiz(QuizSubmission.quiz_id, QuizSubmission.user_id)
-            my_rank_sub = (
-                db.session.query(
-                    QuizSubmission.quiz_id.label("quiz_id"),
-                    QuizSubmission.user_id.label("user_id"),
-                    QuizSubmission.score.label("score"),
-                    QuizSubmission.submitted_at.label("submitted_at"),
-                    func.dense_rank().over(
-                        partition_by=QuizSubmission.quiz_id,
-                        order_by=(
-                            QuizSubmission.score.desc(),
-                            QuizSubmission.submitted_at.asc(),
-                        ),
-                    ).label("rank"),
-                )
-                .filter(QuizSubmission.submitted_at.isnot(None),
-                        flagged,
-                        not_banned_now,)
-                .subquery("my_rank")
-            )
-            rows = (
-                db.session.query(
-                    Quiz.id.label("quiz_id"),
-                    Quiz.title,
-                    Quiz.week_start_date,
-                    Quiz.opens_at,
-                    Quiz.closes_at,
-                    my_rank_sub.c.rank.label("my_rank"),
-                    my_rank_sub.c.score.label("my_score"),
-                    my_rank_sub.c.submitted_at.label("my_submitted_at"),
-                    participants_sq.label("participants"),
-                )
-                .outerjoin(
-                    my_rank_sub,
-                    (my_rank_sub.c.quiz_id == Quiz.id)
-                    & (my_rank_sub.c.user_id == user_id)
-                )
-                .filter(Quiz.closes_at < now)
-                .order_by(Quiz.week_start_date.desc(), Quiz.id.desc())
-                .limit(limit)
-                .offset(offset)
-                .all()
+        mine = aliased(QuizSubmission)
+        mine_join = and_(
+            mine.quiz_id == Quiz.id,
+            mine.user_id == user_id,
+            mine.submitted_at.isnot(None),
+            or_(mine.user_status.is_(None), mine.user_status.notin_(("warned", "banned"))),
+        ) if user_id is not None else false()
+        my_rank = (
+            self._quiz_rank_of(Quiz.id, mine.score, mine.submitted_at)
+            .correlate(Quiz, mine)
+            .scalar_subquery()
+        )
+        query = (
+            db.session.query(
+                Quiz.id.label("quiz_id"),
+                Quiz.title,
+                Quiz.week_start_date,
+                Quiz.opens_at,
+                Quiz.closes_at,
+                case((mine.id.isnot(None), my_rank), else_=None).label("my_rank"),
+                mine.score.label("my_score"),
+                mine.submitted_at.label("my_submitted_at"),
+                participants_sq.label("participants"),
             )
+            .outerjoin(mine, mine_join)
+            .filter(Quiz.closes_at < now)
+        )
+        if after is not None:
+            week_start_date, quiz_id = after
+            query = query.filter(tuple_(Quiz.week_start_date, Quiz.id) < tuple_(week_start_date, quiz_id))
         else:
-            rows = (
-                db.session.query(
-                    Quiz.id.label("quiz_id"),
-                    Quiz.title,
-                    Quiz.week_start_date,
-                    Quiz.opens_at,
-                    Quiz.closes_at,
-                    participants_sq.label("participants"),
-                )
-                .filter(Quiz.closes_at < now)
-                .order_by(Quiz.week_start_date.desc(), Quiz.id.desc())
-                .limit(limit)
-                .offset(offset)
-                .all()
-            )
+            query = query.offset(offset)
+        rows = query.order_by(Quiz.week_start_date.desc(), Quiz.id.desc()).limit(limit).all()
+
         total = (
             db.session.query(func.count(Quiz.id))
-            .filter(Quiz.closes_at < now,
-                    flagged,
-                    not_banned_now,)
+            .filter(Quiz.closes_at < now)
             .scalar()or 0
         )
 
-        return rows, total
\ No newline at end of file
+        return rows, total
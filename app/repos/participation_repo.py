@@ -0,0 +1,105 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import func, text
+from ..extensions import db
+from ..models import QuizParticipation
+
+class ParticipationRepo:
+    def get_status(self, quiz_id: int, user_id: int) -> Optional[str]:
+        return (db.session.query(QuizParticipation.status)
+                .filter(QuizParticipation.quiz_id == quiz_id,
+                        QuizParticipation.user_id == user_id)
+                .scalar())
+
+    def join(self, quiz_id: int, user_id: int, now: datetime) -> bool:
+        """Insert a 'joined' row if the user may join and the quiz has not closed, in one statement.
+
+        False when nothing was inserted (already joined, or a precondition failed; see `diagnose`).
+        """
+        return db.session.execute(text("""
+            INSERT INTO quiz_participation (quiz_id, user_id, status)
+            SELECT q.id, u.id, 'joined'
+            FROM users u, quizzes q
+            WHERE u.id = :user_id AND u.user_status NOT IN ('warned', 'banned')
+              AND q.id = :quiz_id AND q.closes_at > :now
+            ON CONFLICT (quiz_id, user_id) DO NOTHING
+        """), {"quiz_id": quiz_id, "user_id": user_id, "now": now}).rowcount == 1
+
+    def submit(self, quiz_id: int, user_id: int, now: datetime, bonus: int, *, answers: Optional[str] = None,
+               partial_score: Optional[int] = None, answered_count: Optional[int] = None):
+        """Flip joined -> submitted, finalize the submission and credit the user in one statement.
+
+        Every precondition is part of the WHERE clauses, and the status flip takes the participation
+        row lock, so a concurrent second submit matches nothing. The score is the running partial_score
+        plus `bonus`. `answers` (JSON text), `partial_score` and `answered_count` override the stored
+        draft when given.
+        Returns (id, score, submitted_at, username), or None when a precondition failed; the caller
+        must then roll back, since the status flip may have matched while the submission did not.
+        """
+        return db.session.execute(text("""
+            WITH u AS (
+                SELECT id, username FROM users
+                WHERE id = :user_id AND user_status <> 'banned' AND NOT timeout
+            ),
+            q AS (
+                SELECT id FROM quizzes
+                WHERE id = :quiz_id AND published_at IS NOT NULL
+                  AND opens_at <= :now AND closes_at >= :now
+            ),
+            p AS (
+                UPDATE quiz_participation p
+                SET status = 'submitted'
+                FROM u, q
+                WHERE p.quiz_id = q.id AND p.user_id = u.id AND p.status = 'joined'
+                RETURNING p.quiz_id, p.user_id
+            ),
+            s AS (
+                INSERT INTO quiz_submission AS s
+                    (quiz_id, user_id, answers, partial_score, answered_count, score, submitted_at)
+                SELECT p.quiz_id, p.user_id,
+                       COALESCE(CAST(:answers AS jsonb), '{}'::jsonb),
+                       COALESCE(:partial_score, 0), COALESCE(:answered_count, 0),
+                       COALESCE(:partial_score, 0) + :bonus, :now
+                FROM p
+                ON CONFLICT ON CONSTRAINT uq_one_submission_per_quiz DO UPDATE
+                SET answers = COALESCE(CAST(:answers AS jsonb), s.answers),
+                    partial_score = COALESCE(:partial_score, s.partial_score),
+                    answered_count = COALESCE(:answered_count, s.answered_count),
+                    score = COALESCE(:partial_score, s.partial_score) + :bonus,
+                    submitted_at = EXCLUDED.submitted_at
+                WHERE s.submitted_at IS NULL
+                RETURNING s.id, s.user_id, s.score, s.submitted_at
+            ),
+            credited AS (
+                UPDATE users
+                SET points = COALESCE(users.points, 0) + s.score
+                FROM s
+                WHERE users.id = s.user_id
+                RETURNING users.id
+            )
+            SELECT s.id, s.score, s.submitted_at, u.username
+            FROM s JOIN u ON u.id = s.user_id
+        """), {
+            "quiz_id": quiz_id, "user_id": user_id, "now": now,
+            "bonus": bonus,
+            "answers": answers, "partial_score": partial_score, "answered_count": answered_count,
+        }).first()
+
+    def diagnose(self, quiz_id: int, user_id: int):
+        """Everything join/submit check, in one read, to explain why a guarded statement matched nothing."""
+        return db.session.execute(text("""
+            SELECT u.id AS user_id, u.user_status, u.timeout, u.timeout_until,
+                   q.id AS quiz_id, q.published_at, q.opens_at, q.closes_at,
+                   p.status, s.submitted_at
+            FROM (SELECT 1) one
+            LEFT JOIN users u ON u.id = :user_id
+            LEFT JOIN quizzes q ON q.id = :quiz_id
+            LEFT JOIN quiz_participation p ON p.quiz_id = :quiz_id AND p.user_id = :user_id
+            LEFT JOIN quiz_submission s ON s.quiz_id = :quiz_id AND s.user_id = :user_id
+        """), {"quiz_id": quiz_id, "user_id": user_id}).one()
+
+    def count_by_status(self, quiz_id: int, status: str) -> int:
+        return (db.session.query(func.count(QuizParticipation.user_id))
+                .filter(QuizParticipation.quiz_id == quiz_id,
+                        QuizParticipation.status == status)
+                .scalar() or 0)
@@ -8,6 +8,12 @@ class QuizRepo:
     def get_by_id(self, quiz_id:int):
         return db.session.get(Quiz, quiz_id)
     
+    def get_window(self, quiz_id:int):
+        # column-only: loading Quiz itself would pull questions/options through the selectin relationship
+        return (db.session.query(Quiz.id, Quiz.published_at, Quiz.opens_at, Quiz.closes_at)
+                .filter(Quiz.id == quiz_id)
+                .first())
+
     def get_with_question(self, quiz_id:int):
         return (db.session.query(Quiz)
                 .options(selectinload(Quiz.questions).selectinload(QuizQuestion.options))
@@ -40,6 +46,25 @@ class QuizRepo:
                 Quiz.published_at.isnot(None)
             )
         ).first()
+
+    def get_active_id(self, now) -> Optional[int]:
+        return (
+            db.session.query(Quiz.id)
+            .filter(
+                Quiz.opens_at <= now,
+                Quiz.closes_at >= now,
+                Quiz.published_at.isnot(None)
+            )
+            .limit(1)
+        ).scalar()
+
+    def list_unfrozen(self) -> List[Tuple[int, object]]:
+        """(id, closes_at) of every quiz whose board the close job has not frozen yet."""
+        return (db.session.query(Quiz.id, Quiz.closes_at)
+                .filter(Quiz.leaderboard_frozen_at.is_(None))
+                .order_by(Quiz.closes_at)
+                .all())
+
     def question_exists(self, quiz_id: int, question_id: int) -> bool:
         return db.session.query(QuizQuestion.id).filter(
             QuizQuestion.id == question_id, QuizQuestion.quiz_id == quiz_id).limit(1).first() is not None
@@ -115,4 +140,10 @@ class QuizRepo:
           .options(selectinload(QuizQuestion.options))
           .filter_by(id=question_id, quiz_id=quiz_id)
           .first())
-    
+
+    def set_option_correct(self, quiz_id: int, option_id: int, is_correct: bool) -> bool:
+        in_quiz = select(QuizQuestion.id).where(QuizQuestion.quiz_id == quiz_id)
+        updated = (db.session.query(QuizOption)
+                   .filter(QuizOption.id == option_id, QuizOption.question_id.in_(in_quiz))
+                   .update({QuizOption.is_correct: is_correct}, synchronize_session=False))
+        return updated > 0
@@ -1,4 +1,7 @@
-from sqlalchemy import select, func
+import json
+from typing import Optional
+from sqlalchemy import select, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from ..extensions import db
 from ..models import QuizSubmission
 
@@ -10,12 +13,119 @@ class SubmissionRepo:
                 .first())
     
     def add_draft(self, quiz_id:int, user_id:int) -> QuizSubmission:
-        sub = QuizSubmission(quiz_id=quiz_id, user_id=user_id, answers={}, score=0, submitted_at = None)
-        
-        db.session.add(sub)
-        db.session.flush()
-        return sub
+        """Create the user's draft, or return the one a concurrent request just created (it may be submitted)."""
+        db.session.execute(
+            pg_insert(QuizSubmission.__table__)
+            .values(quiz_id=quiz_id, user_id=user_id, answers={}, score=0, submitted_at=None,
+                    partial_score=0, answered_count=0)
+            .on_conflict_do_nothing(constraint="uq_one_submission_per_quiz")
+        )
+        return self.get_for_user(quiz_id, user_id)
     
+    def upsert_draft_answers(self, rows: list[dict]) -> None:
+        # rows: {"quiz_id", "user_id", "answers", "partial_score", "answered_count"}; submitted rows are never touched
+        if not rows:
+            return
+        table = QuizSubmission.__table__
+        stmt = pg_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_one_submission_per_quiz",
+            set_={
+                "answers": stmt.excluded.answers,
+                "partial_score": stmt.excluded.partial_score,
+                "answered_count": stmt.excluded.answered_count,
+                "version": table.c.version + 1,
+            },
+            where=table.c.submitted_at.is_(None),
+        )
+        db.session.execute(stmt)
+
+    def patch_answers(self, sub_id: int, expected_version: int, changes: dict[str, Optional[int]], *,
+                      partial_score: int, answered_count: int) -> Optional[int]:
+        """Write only the changed answer keys if the draft is still at `expected_version`.
+
+        A single change is a jsonb_set on its key, a batch is merged with ||. Returns the new version,
+        or None when another write got there first (or the draft was submitted).
+        """
+        if len(changes) == 1:
+            [(field, option_id)] = changes.items()
+            answers_expr = "jsonb_set(answers, ARRAY[:field], CAST(:value AS jsonb), true)"
+            params = {"field": field, "value": json.dumps(option_id)}
+        else:
+            answers_expr = "answers || CAST(:patch AS jsonb)"
+            params = {"patch": json.dumps(changes)}
+        return db.session.execute(text(f"""
+            UPDATE quiz_submission
+            SET answers = {answers_expr},
+                partial_score = :partial_score,
+                answered_count = :answered_count,
+                version = version + 1
+            WHERE id = :id AND version = :expected_version AND submitted_at IS NULL
+            RETURNING version
+        """), {**params, "id": sub_id, "expected_version": expected_version,
+               "partial_score": partial_score, "answered_count": answered_count}).scalar()
+
+    def finalize_drafts_chunk(self, quiz_id: int, after_id: int, limit: int, at, bonus: int,
+                              points_by_difficulty: dict[str, int]) -> tuple[Optional[int], int, int]:
+        """Submit the next `limit` answered drafts (by id, after `after_id`) as of `at` in one statement.
+
+        Each is scored from its answers against the current is_correct flags, like rescore_quiz, so a
+        rescore after the answers were saved is honoured; the score is that plus `bonus`. Its
+        participation is marked submitted and the scores are credited to users.points. Drafts of users
+        who could not submit by hand (banned or on timeout, the guard of ParticipationRepo.submit) and
+        empty drafts are skipped, and rows submitted concurrently are left alone.
+        Returns (last id scanned or None when done, finalized, points).
+        """
+        points_expr, params = self._points_case(points_by_difficulty)
+        row = db.session.execute(text(f"""
+            WITH chunk AS (
+                SELECT s.id, COALESCE(c.points, 0) AS correct_points
+                FROM quiz_submission s
+                JOIN users u ON u.id = s.user_id AND u.user_status <> 'banned' AND NOT u.timeout
+                LEFT JOIN LATERAL (
+                    SELECT sum({points_expr}) AS points
+                    FROM jsonb_each_text(s.answers) a(question_id, option_id)
+                    JOIN quiz_options o ON o.id = a.option_id::int
+                                       AND o.question_id = a.question_id::int
+                                       AND o.is_correct
+                    JOIN quiz_questions q ON q.id = o.question_id AND q.quiz_id = s.quiz_id
+                ) c ON true
+                WHERE s.quiz_id = :quiz_id AND s.submitted_at IS NULL
+                  AND s.answered_count > 0 AND s.id > :after_id
+                ORDER BY s.id
+                LIMIT :limit
+            ),
+            done AS (
+                UPDATE quiz_submission s
+                SET submitted_at = :at,
+                    partial_score = chunk.correct_points,
+                    score = chunk.correct_points + :bonus,
+                    version = s.version + 1
+                FROM chunk
+                WHERE s.id = chunk.id AND s.submitted_at IS NULL
+                RETURNING s.user_id, s.score
+            ),
+            joined AS (
+                UPDATE quiz_participation p
+                SET status = 'submitted'
+                FROM done
+                WHERE p.quiz_id = :quiz_id AND p.user_id = done.user_id
+                RETURNING p.user_id
+            ),
+            credited AS (
+                UPDATE users u
+                SET points = COALESCE(u.points, 0) + done.score
+                FROM done
+                WHERE u.id = done.user_id
+                RETURNING u.id
+            )
+            SELECT (SELECT max(id) FROM chunk) AS last_id,
+                   count(*) AS finalized,
+                   COALESCE(sum(score), 0) AS points
+            FROM done
+        """), {**params, "quiz_id": quiz_id, "after_id": after_id, "limit": limit, "at": at, "bonus": bonus}).one()
+        return row.last_id, int(row.finalized), int(row.points)
+
     def update_score(self, sub:QuizSubmission, score:int):
         sub.score = score
 
@@ -26,6 +136,10 @@ class SubmissionRepo:
     def set_answers(self, sub: QuizSubmission, answers_dict: dict[int,int])->None:
         sub.answers = answers_dict
 
+    def set_running_score(self, sub: QuizSubmission, *, partial_score: int, answered_count: int) -> None:
+        sub.partial_score = partial_score
+        sub.answered_count = answered_count
+
     def set_action_snapshot(self, sub: QuizSubmission, *, action_time, user_status: str)-> None:
         sub.action_time = action_time
         sub.user_status = user_status
@@ -34,3 +148,63 @@ class SubmissionRepo:
         return db.session.query(func.count(QuizSubmission.user_id)).filter(QuizSubmission.quiz_id == quiz_id,
                                                                            QuizSubmission.submitted_at.isnot(None)
                                                                            ).scalar() or 0
+
+    @staticmethod
+    def _points_case(points_by_difficulty: dict[str, int]) -> tuple[str, dict]:
+        """SQL for a question's points (alias q), as AnswerKey scores it, plus its bind params."""
+        params, whens = {}, []
+        for i, (difficulty, points) in enumerate(points_by_difficulty.items()):
+            whens.append(f"WHEN :diff_{i} THEN :points_{i}")
+            params[f"diff_{i}"] = difficulty
+            params[f"points_{i}"] = points
+        return f"CASE q.difficulty::text {' '.join(whens)} ELSE q.points END", params
+
+    def rescore_quiz(self, quiz_id: int, points_by_difficulty: dict[str, int]) -> tuple[int, int]:
+        """Recompute every submission of a quiz from the current is_correct flags in one statement.
+
+        Submitted rows get correct points plus their submit-day bonus, drafts only get a fresh
+        partial_score. Score deltas are credited to users.points in the same statement.
+        Returns (submissions whose score changed, total points delta).
+        """
+        points_expr, params = self._points_case(points_by_difficulty)
+        params["quiz_id"] = quiz_id
+
+        row = db.session.execute(text(f"""
+            WITH scored AS (
+                SELECT s.id, s.user_id, s.score AS old_score,
+                       COALESCE(c.points, 0) AS correct_points,
+                       CASE WHEN s.submitted_at IS NULL THEN s.score
+                            ELSE COALESCE(c.points, 0)
+                                 + (7 - EXTRACT(ISODOW FROM s.submitted_at AT TIME ZONE 'UTC'))::int
+                       END AS new_score
+                FROM quiz_submission s
+                LEFT JOIN LATERAL (
+                    SELECT sum({points_expr}) AS points
+                    FROM jsonb_each_text(s.answers) a(question_id, option_id)
+                    JOIN quiz_options o ON o.id = a.option_id::int
+                                       AND o.question_id = a.question_id::int
+                                       AND o.is_correct
+                    JOIN quiz_questions q ON q.id = o.question_id AND q.quiz_id = s.quiz_id
+                ) c ON true
+                WHERE s.quiz_id = :quiz_id
+            ),
+            changed AS (
+                UPDATE quiz_submission s
+                SET score = scored.new_score, partial_score = scored.correct_points
+                FROM scored
+                WHERE s.id = scored.id
+                  AND (s.score <> scored.new_score OR s.partial_score <> scored.correct_points)
+                RETURNING s.user_id, scored.new_score - scored.old_score AS delta
+            ),
+            credited AS (
+                UPDATE users u
+                SET points = COALESCE(u.points, 0) + changed.delta
+                FROM changed
+                WHERE u.id = changed.user_id AND changed.delta <> 0
+                RETURNING u.id
+            )
+            SELECT count(*) FILTER (WHERE delta <> 0) AS rescored,
+                   COALESCE(sum(delta), 0) AS points_delta
+            FROM changed
+        """), params).one()
+        return int(row.rescored), int(row.points_delta)
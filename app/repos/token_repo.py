@@ -1,9 +1,9 @@
 from __future__ import annotations
 from datetime import datetime
 from typing import Optional, Union
-from sqlalchemy import ClauseElement, func, or_, delete
+from sqlalchemy import ClauseElement, func, or_, delete, update
 from ..extensions import db
-from ..models import RefreshToken
+from ..models import RefreshToken, User
 
 class TokenRepo:
     def has_active_for_user(self, user_id:int)->bool:
@@ -43,12 +43,36 @@ class TokenRepo:
         row.revoked_at = when
         return True
     
-    def revoke_all_for_user(self, user_id: int, when: Union[datetime, ClauseElement]) -> int:
-        q = (
-            db.session.query(RefreshToken)
-            .filter(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+    def revoke_all_for_user(self, user_id: int, when: Union[datetime, ClauseElement]) -> list[str]:
+        stmt = (
+            update(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=when)
+            .returning(RefreshToken.jti)
+            .execution_options(synchronize_session=False)
         )
-        return q.update({RefreshToken.revoked_at: when}, synchronize_session=False)
+        return list(db.session.execute(stmt).scalars())
+
+    def rotate(
+            self, old_jti: str, user_id: int, *, jti: str, token_hash: str, expires_at: datetime, device: Optional[str]
+    ) -> Optional[str]:
+        """Swap a live refresh token for a new one in place. Returns the owner's role, or None when
+        the old token is unknown, revoked, expired or not the user's."""
+        stmt = (
+            update(RefreshToken)
+            .where(
+                RefreshToken.jti == old_jti,
+                RefreshToken.user_id == user_id,
+                RefreshToken.revoked_at.is_(None),
+                RefreshToken.expires_at > func.now(),
+                User.id == RefreshToken.user_id,
+            )
+            .values(jti=jti, token_hash=token_hash, expires_at=expires_at, device=device,
+                    created_at=func.now(), revoked_at=None)
+            .returning(User.role)
+            .execution_options(synchronize_session=False)
+        )
+        return db.session.execute(stmt).scalar()
     
     def delete_by_jti(self, jti:str) -> bool:
         row = db.session.get(RefreshToken,jti)
@@ -57,13 +81,18 @@ class TokenRepo:
         db.session.delete(row)
         return True
     
-    def delete_all_for_user(self, user_id: int) -> int:
-        return (
-            db.session.query(RefreshToken)
-            .filter_by(user_id=user_id)
-            .delete(synchronize_session=False)
+    def delete_all_for_user(self, user_id: int) -> list[str]:
+        stmt = (
+            delete(RefreshToken)
+            .where(RefreshToken.user_id == user_id)
+            .returning(RefreshToken.jti)
+            .execution_options(synchronize_session=False)
         )
+        return list(db.session.execute(stmt).scalars())
     
+    @staticmethod
+    def expired_or_revoked():
+        return or_(RefreshToken.expires_at <= func.now(), RefreshToken.revoked_at.isnot(None))
+
     def cleanup_expired_or_revoked(self):
-        db.session.execute(delete(RefreshToken).where(or_(RefreshToken.expires_at <= func.now(),
-                                RefreshToken.revoked_at.isnot(None))))
+        db.session.execute(delete(RefreshToken).where(self.expired_or_revoked()))
@@ -12,9 +12,6 @@ class UserRepo:
     def get_user_by_username(self, username:str)-> Optional[User]:
         return db.session.query(User).filter_by(username= username).first()
     
-    def update_join_status(self, user: User, status:str):
-        user.join_status = status
-
     def update_score(self, user:User, points:int):
         user.points = user.points + points
 
@@ -43,9 +40,3 @@ class UserRepo:
         user.user_status = "banned"
         user.timeout = True
         user.timeout_until = None 
-
-    def count_joined_current(self)-> int:
-        return db.session.query(func.count(User.id)).filter(User.join_status == "joined").scalar() or 0
-
-    def count_submitted_current(self, quiz_id:int)-> int:
-        return db.session.query(func.count(User.id)).filter(User.join_status == "submitted").scalar() or 0
@@ -5,69 +5,49 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.schedulers.base import SchedulerNotRunningError
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
 import os
 from .services.token_service import cleanup_tokens
+from .services.draft_buffer import flush_drafts
+from .services.leaderboard_snapshot import FREEZE_GRACE
+from .services import live_leaderboard, mail_outbox, participant_counter
 from zoneinfo import ZoneInfo
 from .config import Config
 from .extensions import db
 
-def _do_global_join_status_reset(app) -> int:
-    from .models import User
+def _close_quiz(app, quiz_id: int) -> None:
+    from .services import quiz_close
     with app.app_context():
-        updated = (
-            db.session.query(User)
-                .filter(User.join_status != "not_joined")
-                .update({User.join_status: "not_joined"}, synchronize_session = False)
-        )
-        db.session.commit()
-        app.logger.warning("not joined for %s users (quiz_id=%s)", updated)
-        return updated
+        try:
+            quiz_close.close_quiz(quiz_id)
+        except ValueError:
+            db.session.rollback()
+            app.logger.warning("Quiz %s not found; skipping close", quiz_id)
+        except Exception:
+            db.session.rollback()
+            raise
 
-def _reset_all_users_join_status(app, quiz_id:int) -> None:
-    from .models import User, Quiz
-    with app.app_context():
-        q = db.session.get(Quiz, quiz_id)
-        
-        if not q:
-            app.logger.warning("Quiz %s not found; skipping scheduled reset", quiz_id)
-            return
-        now = datetime.now(timezone.utc)
-        if q.closes_at is not None and q.closes_at <= now:
-            _do_global_join_status_reset(app)
-        else:
-            app.logger.warning("Scheduled reset skiped: quiz %s not yet closed.", quiz_id)
-
-def schedule_quiz_close_reset(
+def schedule_quiz_close(
         scheduler: BackgroundScheduler, app, quiz_id:int, closes_at
 ) -> None:
+    """Schedule the work that runs when a quiz closes; calling it again moves it to the new closes_at.
+
+    After the grace period unsubmitted drafts are finalized and the board is frozen. Participation
+    is per quiz, so closing needs no join-status reset.
+    """
     if closes_at.tzinfo is None:
         closes_at = closes_at.replace(tzinfo = ZoneInfo(Config.SCHEDULER_TIMEZONE))
 
-    job_id = f"reset-join-status-{quiz_id}"
-
-    try:
-        scheduler.remove_job(job_id)
-    except Exception:
-        pass
-
     scheduler.add_job(
-        func = _reset_all_users_join_status,
-        trigger = DateTrigger(run_date = closes_at),
+        func = _close_quiz,
+        trigger = DateTrigger(run_date = closes_at + FREEZE_GRACE),
         args = [app, quiz_id],
-        id = job_id,
+        id = f"close-quiz-{quiz_id}",
         replace_existing = True,
         coalesce = False,
         misfire_grace_time = None,
     )
-
-def reset_join_status_now(app, scheduler: BackgroundScheduler, quiz_id: int) -> None:
-    job_id = f"reset-join-status-{quiz_id}"
-    try:
-        scheduler.remove_job(job_id)
-    except Exception:
-        pass
-    _do_global_join_status_reset(app)
     
 def start_scheduler(app) -> None:
 
@@ -87,6 +67,96 @@ def start_scheduler(app) -> None:
         replace_existing=True,
     )
 
+    def reconcile_participants_job():
+        from .repos.quiz_repo import QuizRepo
+        with app.app_context():
+            quiz_id = QuizRepo().get_active_id(datetime.now(timezone.utc))
+            if quiz_id is not None:
+                participant_counter.reconcile(quiz_id)
+            db.session.rollback()
+
+    scheduler.add_job(
+        reconcile_participants_job,
+        IntervalTrigger(seconds=Config.PARTICIPANT_RECONCILE_SECONDS),
+        id="reconcile-participants",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+    )
+
+    # close jobs only live in the process that scheduled them: re-arm the upcoming ones and close
+    # any quiz whose close was missed (restart, deploy). Also runs once at startup.
+    def close_sweep_job():
+        from .repos.quiz_repo import QuizRepo
+        with app.app_context():
+            quizzes = QuizRepo().list_unfrozen()
+            db.session.rollback()
+        now = datetime.now(timezone.utc)
+        for quiz_id, closes_at in quizzes:
+            if closes_at.tzinfo is None:
+                closes_at = closes_at.replace(tzinfo=ZoneInfo(Config.SCHEDULER_TIMEZONE))
+            if closes_at + FREEZE_GRACE > now:
+                if scheduler.get_job(f"close-quiz-{quiz_id}") is None:
+                    schedule_quiz_close(scheduler, app, quiz_id, closes_at)
+                continue
+            app.logger.warning("quiz %s closed at %s but was never frozen; closing it now", quiz_id, closes_at)
+            _close_quiz(app, quiz_id)
+
+    scheduler.add_job(
+        close_sweep_job,
+        IntervalTrigger(seconds=Config.QUIZ_CLOSE_SWEEP_SECONDS),
+        id="sweep-quiz-close",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        next_run_time=datetime.now(timezone.utc),
+    )
+
+    # reads fall back to Postgres until the active quiz's live board exists (e.g. after a redis flush)
+    def live_leaderboard_job():
+        from .repos.quiz_repo import QuizRepo
+        with app.app_context():
+            quiz_id = QuizRepo().get_active_id(datetime.now(timezone.utc))
+            if quiz_id is not None:
+                live_leaderboard.ensure_built(quiz_id)
+            db.session.rollback()
+
+    scheduler.add_job(
+        live_leaderboard_job,
+        IntervalTrigger(seconds=Config.LIVE_LEADERBOARD_CHECK_SECONDS),
+        id="build-live-leaderboard",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+    )
+
+    def send_mail_job():
+        with app.app_context():
+            mail_outbox.send_pending()
+
+    scheduler.add_job(
+        send_mail_job,
+        IntervalTrigger(seconds=Config.MAIL_OUTBOX_SEND_SECONDS),
+        id="send-mail-outbox",
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+    )
+
+    if Config.ANSWER_DRAFT_BUFFER:
+        def flush_job():
+            with app.app_context():
+                flush_drafts()
+
+        scheduler.add_job(
+            flush_job,
+            IntervalTrigger(seconds=Config.ANSWER_DRAFT_FLUSH_SECONDS),
+            id="flush-answer-drafts",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
+
     scheduler.start()
     import atexit
     def _shutdown():
@@ -28,6 +28,22 @@ class QuizCreateSchema(Schema):
 
 class AnswerSchema(Schema):
     option_id = fields.Int(required=False, allow_none=True, load_default=None)
+    version = fields.Int(required=False, allow_none=True, load_default=None)
+
+class AnswerItemSchema(Schema):
+    question_id = fields.Int(required=True)
+    option_id = fields.Int(required=False, allow_none=True, load_default=None)
+
+class BatchAnswerSchema(Schema):
+    answers = fields.List(fields.Nested(AnswerItemSchema), required=True, validate=validate.Length(min=1, max=100))
+    version = fields.Int(required=False, allow_none=True, load_default=None)
+
+class OptionCorrectionSchema(Schema):
+    option_id = fields.Int(required=True)
+    is_correct = fields.Bool(required=True)
+
+class RescoreSchema(Schema):
+    corrections = fields.List(fields.Nested(OptionCorrectionSchema), load_default=[])
 
 class QuizBriefSchema(Schema):
     id = fields.Int()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional
+from ..models import Quiz
+from ..repos.quiz_repo import QuizRepo
+from . import quiz_cache
+
+quiz_repo = QuizRepo()
+
+POINTS_BY_DIFF = {"easy": 5, "medium": 10, "hard":20}
+
+def question_points(difficulty: str | None, points: int | None) -> int:
+    return int(POINTS_BY_DIFF.get(difficulty, points or 0))
+
+@dataclass(frozen=True)
+class AnswerKey:
+    """Everything needed to validate and score answers for one quiz version, without the ORM graph."""
+    quiz_id: int
+    option_question: Mapping[int, int]      # option id -> question id
+    correct: Mapping[int, frozenset]        # question id -> correct option ids
+    points: Mapping[int, int]               # question id -> points for a correct answer
+
+    def has_question(self, question_id: int) -> bool:
+        return question_id in self.points
+
+    def option_belongs(self, option_id: Optional[int], question_id: int) -> bool:
+        return option_id is None or self.option_question.get(option_id) == question_id
+
+    def points_for(self, question_id: int, option_id: Optional[int]) -> int:
+        if option_id is not None and option_id in self.correct.get(question_id, ()):
+            return self.points[question_id]
+        return 0
+
+    def score(self, answers: dict) -> int:
+        total = 0
+        for qid, oid in (answers or {}).items():
+            total += self.points_for(int(qid), int(oid) if oid is not None else None)
+        return total
+
+    def to_dict(self) -> dict:
+        return {
+            "quiz_id": self.quiz_id,
+            "options": {str(oid): qid for oid, qid in self.option_question.items()},
+            "correct": {str(qid): sorted(oids) for qid, oids in self.correct.items()},
+            "points": {str(qid): pts for qid, pts in self.points.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AnswerKey":
+        return cls(
+            quiz_id=int(data["quiz_id"]),
+            option_question=MappingProxyType({int(k): int(v) for k, v in data["options"].items()}),
+            correct=MappingProxyType({int(k): frozenset(v) for k, v in data["correct"].items()}),
+            points=MappingProxyType({int(k): int(v) for k, v in data["points"].items()}),
+        )
+
+    @classmethod
+    def from_quiz(cls, quiz: Quiz) -> "AnswerKey":
+        return cls(
+            quiz_id=quiz.id,
+            option_question=MappingProxyType({o.id: q.id for q in quiz.questions for o in q.options}),
+            correct=MappingProxyType({q.id: frozenset(o.id for o in q.options if o.is_correct) for q in quiz.questions}),
+            points=MappingProxyType({q.id: question_points(q.difficulty, q.points) for q in quiz.questions}),
+        )
+
+def _build(quiz_id: int) -> dict | None:
+    quiz = quiz_repo.get_with_question(quiz_id)
+    return AnswerKey.from_quiz(quiz).to_dict() if quiz else None
+
+def get_answer_key(quiz_id: int) -> AnswerKey | None:
+    return quiz_cache.get_or_build(quiz_id, "answer_key", lambda: _build(quiz_id), decode=AnswerKey.from_dict)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import json
+from typing import NamedTuple, Optional, Sequence
+import numpy as np
+from flask import current_app
+from sqlalchemy import text
+from ..extensions import db, redis_client
+from . import leaderboard_snapshot, quiz_cache
+from .answer_key import AnswerKey, get_answer_key
+
+UNANSWERED = -1
+
+class AnswerMatrix(NamedTuple):
+    question_ids: np.ndarray        # (questions,) column order
+    submission_ids: np.ndarray      # (rows,)
+    user_ids: np.ndarray            # (rows,)
+    answers: np.ndarray             # (rows, questions) int32 option ids, UNANSWERED where blank
+
+class KeyVectors(NamedTuple):
+    option_ids: np.ndarray          # every option of the quiz, sorted
+    option_col: np.ndarray          # matrix column of the option's question, -1 when it is not a column
+    option_points: np.ndarray       # points for picking the option, 0 when it is wrong
+
+# one int[] per submission, already in column order, so rows go straight into the matrix
+_ROWS = text("""
+    SELECT s.id, s.user_id,
+           ARRAY(SELECT COALESCE((s.answers ->> q.id::text)::int, -1)
+                 FROM unnest(CAST(:question_ids AS int[])) WITH ORDINALITY AS q(id, n)
+                 ORDER BY q.n) AS answers
+    FROM quiz_submission s
+    WHERE s.quiz_id = :quiz_id AND (s.submitted_at IS NOT NULL OR NOT :submitted_only)
+    ORDER BY s.id
+""")
+
+def load_matrix(quiz_id: int, question_ids: Sequence[int], *, submitted_only: bool = True,
+                chunk_size: Optional[int] = None) -> AnswerMatrix:
+    """Stream a quiz's submissions through a server-side cursor into a dense answer matrix."""
+    chunk_size = chunk_size or current_app.config.get("ANALYTICS_CHUNK_SIZE", 50000)
+    width = len(question_ids)
+    result = db.session.execute(
+        _ROWS,
+        {"quiz_id": quiz_id, "question_ids": [int(q) for q in question_ids], "submitted_only": submitted_only},
+        execution_options={"stream_results": True, "yield_per": chunk_size},
+    )
+    ids, users, blocks = [], [], []
+    for part in result.partitions(chunk_size):
+        ids.append(np.fromiter((r[0] for r in part), dtype=np.int64, count=len(part)))
+        users.append(np.fromiter((r[1] for r in part), dtype=np.int64, count=len(part)))
+        blocks.append(np.array([r[2] for r in part], dtype=np.int32).reshape(len(part), width))
+
+    if not blocks:
+        empty = np.empty(0, dtype=np.int64)
+        return AnswerMatrix(np.asarray(question_ids, dtype=np.int32), empty, empty,
+                            np.empty((0, width), dtype=np.int32))
+    return AnswerMatrix(np.asarray(question_ids, dtype=np.int32), np.concatenate(ids), np.concatenate(users),
+                        np.concatenate(blocks))
+
+def key_vectors(key: AnswerKey, question_ids: Sequence[int]) -> KeyVectors:
+    col_of = {int(q): i for i, q in enumerate(question_ids)}
+    options = sorted(key.option_question)
+    return KeyVectors(
+        option_ids=np.array(options, dtype=np.int32),
+        option_col=np.array([col_of.get(key.option_question[o], -1) for o in options], dtype=np.int32),
+        option_points=np.array([key.points_for(key.option_question[o], o) for o in options], dtype=np.int32),
+    )
+
+def answer_points(matrix: AnswerMatrix, vectors: KeyVectors) -> np.ndarray:
+    """Points earned per (row, question), the vectorized AnswerKey.points_for.
+
+    Option ids are mapped to key positions with searchsorted; an answer only scores when the
+    option exists, belongs to that column's question and is correct.
+    """
+    answers = matrix.answers
+    if vectors.option_ids.size == 0:
+        return np.zeros(answers.shape, dtype=np.int32)
+    idx = np.searchsorted(vectors.option_ids, answers)
+    np.minimum(idx, vectors.option_ids.size - 1, out=idx)
+    valid = (vectors.option_ids[idx] == answers) & (vectors.option_col[idx] == np.arange(answers.shape[1]))
+    return np.where(valid, vectors.option_points[idx], 0).astype(np.int32, copy=False)
+
+def score_matrix(matrix: AnswerMatrix, vectors: KeyVectors) -> np.ndarray:
+    """Correct-answer points per row, equal to AnswerKey.score on the same answers."""
+    return answer_points(matrix, vectors).sum(axis=1, dtype=np.int32)
+
+def question_stats(matrix: AnswerMatrix, points: np.ndarray) -> list[dict]:
+    rows = matrix.answers.shape[0]
+    answered = (matrix.answers != UNANSWERED).sum(axis=0)
+    correct = (points > 0).sum(axis=0)
+    return [
+        {
+            "question_id": int(qid),
+            "answered": int(a),
+            "correct": int(c),
+            "answer_rate": round(a / rows, 4) if rows else None,
+            "correct_rate": round(c / a, 4) if a else None,
+        }
+        for qid, a, c in zip(matrix.question_ids.tolist(), answered.tolist(), correct.tolist())
+    ]
+
+def quiz_report(quiz_id: int) -> dict:
+    """Score distribution and per-question answer/correct rates over a quiz's submitted answers.
+
+    Scores are correct-answer points only; the submit-day bonus is not part of the answers.
+    The whole matrix is held in memory: rows x questions x 4 bytes, about 40 MB for 1M submissions
+    of 10 questions, plus one chunk of decoded rows while streaming. Serve it through cached_report.
+    """
+    key = get_answer_key(quiz_id)
+    if key is None:
+        raise ValueError("Quiz not found")
+    question_ids = sorted(key.points)
+    matrix = load_matrix(quiz_id, question_ids)
+    points = answer_points(matrix, key_vectors(key, question_ids))
+    scores = points.sum(axis=1, dtype=np.int32)
+
+    summary = None
+    if scores.size:
+        summary = {
+            "mean": round(float(scores.mean()), 2),
+            "median": float(np.median(scores)),
+            "p90": float(np.percentile(scores, 90)),
+            "min": int(scores.min()),
+            "max": int(scores.max()),
+        }
+    return {
+        "quiz_id": quiz_id,
+        "submissions": int(scores.size),
+        "score": summary,
+        "questions": question_stats(matrix, points),
+    }
+
+def _live_key(quiz_id: int, version: int) -> str:
+    return f"quiz:{quiz_id}:v{version}:analytics:live"
+
+def cached_report(quiz_id: int) -> dict:
+    """quiz_report, built at most once per quiz version instead of on every request.
+
+    Once the board is frozen no submission changes any more, so the report is cached with the
+    answer key (a rescore bumps the quiz version). While the quiz is open it is rebuilt at most
+    every ANALYTICS_LIVE_TTL seconds.
+    """
+    frozen_at = leaderboard_snapshot.version(quiz_id)
+    if frozen_at is not None:
+        return quiz_cache.get_or_build(
+            quiz_id, f"analytics:{int(frozen_at.timestamp() * 1000)}", lambda: quiz_report(quiz_id))
+
+    key = _live_key(quiz_id, quiz_cache.get_version(quiz_id))
+    raw = redis_client.get(key)
+    if raw is not None:
+        return json.loads(raw)
+    report = quiz_report(quiz_id)
+    redis_client.setex(key, current_app.config.get("ANALYTICS_LIVE_TTL", 60), json.dumps(report))
+    return report
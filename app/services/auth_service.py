@@ -2,7 +2,7 @@ from __future__ import annotations
 from typing import Optional
 from ..models import User
 from ..extensions import db
-from ..utils.security import check_password, hash_password
+from ..utils.security import PasswordHasherBusy, check_password, hash_password, password_needs_rehash
 from ..repos.user_repo import UserRepo
 
 user_repo = UserRepo()
@@ -13,6 +13,13 @@ def authenticate(username: str, password:str)->Optional[User] | None:
         return None
     if not check_password(user.password, password):
         return None
+    if password_needs_rehash(user.password):
+        # cost factor changed since this hash was made; the caller's commit stores the new one.
+        # Optional: with the hasher pool saturated the next login retries it instead.
+        try:
+            user_repo.update_password_hash(user, hash_password(password))
+        except PasswordHasherBusy:
+            pass
     return user
 
 def change_password(user_id: int, old_password: str, new_password: str, new_password_again:str) -> None:
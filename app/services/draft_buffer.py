@@ -0,0 +1,168 @@
+from __future__ import annotations
+from typing import NamedTuple, Optional
+from flask import current_app
+from ..extensions import db, redis_client
+from ..repos.submission_repo import SubmissionRepo
+from ..utils.tx import after_commit
+
+submission_repo = SubmissionRepo()
+
+_DIRTY = "draft:dirty"      # set of "<quiz_id>:<user_id>" waiting for a flush
+_SUB_FIELD = "_sub"         # postgres submission id, when one exists
+_PARTIAL_FIELD = "_partial"
+_COUNT_FIELD = "_count"
+
+# answer fields are "<option_id>:<points awarded>" so the running totals can be kept inside redis
+_SEED = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+""")
+
+# returns nil when the hash is missing (never seeded, or expired): the caller seeds it and saves again,
+# so the running totals never restart from zero on a hash that lacks the postgres draft
+_SAVE = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+local partial, count = 0, 0
+for i = 3, #ARGV, 2 do
+  local old = redis.call('HGET', KEYS[1], ARGV[i])
+  if old then
+    partial = partial - tonumber(string.match(old, ':(%-?%d+)$'))
+  else
+    count = count + 1
+  end
+  redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+  partial = partial + tonumber(string.match(ARGV[i + 1], ':(%-?%d+)$'))
+end
+partial = redis.call('HINCRBY', KEYS[1], '_partial', partial)
+count = redis.call('HINCRBY', KEYS[1], '_count', count)
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('SADD', KEYS[2], ARGV[2])
+return {partial, count, redis.call('HGET', KEYS[1], '_sub')}
+""")
+
+_SAVE_ATTEMPTS = 3
+
+class Draft(NamedTuple):
+    answers: dict
+    partial_score: int
+    answered_count: int
+    submission_id: Optional[int]
+
+def _draft_key(quiz_id: int, user_id: int) -> str:
+    return f"draft:{quiz_id}:{user_id}"
+
+def _member(quiz_id: int, user_id: int) -> str:
+    return f"{quiz_id}:{user_id}"
+
+def _encode(option_id: Optional[int], points: int) -> str:
+    return f"{'' if option_id is None else option_id}:{points}"
+
+def _decode(raw: str) -> Optional[int]:
+    option_id = raw.rsplit(":", 1)[0]
+    return None if option_id == "" else int(option_id)
+
+def _to_draft(data: dict) -> Draft:
+    answers = {int(k): _decode(v) for k, v in data.items() if not k.startswith("_")}
+    sub_id = data.get(_SUB_FIELD)
+    return Draft(
+        answers=answers,
+        partial_score=int(data.get(_PARTIAL_FIELD, 0)),
+        answered_count=int(data.get(_COUNT_FIELD, 0)),
+        submission_id=int(sub_id) if sub_id else None,
+    )
+
+def enabled() -> bool:
+    return bool(current_app.config.get("ANSWER_DRAFT_BUFFER"))
+
+def _seed(quiz_id: int, user_id: int, key) -> None:
+    # first touch for this user: mirror the postgres draft so the hash is the complete answer set
+    sub = submission_repo.get_for_user(quiz_id, user_id) or submission_repo.add_draft(quiz_id, user_id)
+    if sub.submitted_at:
+        raise ValueError("Already submitted, cannot change answers")
+
+    fields = [_SUB_FIELD, sub.id, _PARTIAL_FIELD, sub.partial_score, _COUNT_FIELD, sub.answered_count]
+    for qid, oid in (sub.answers or {}).items():
+        oid = int(oid) if oid is not None else None
+        fields += [str(qid), _encode(oid, key.points_for(int(qid), oid))]
+    _SEED(keys=[_draft_key(quiz_id, user_id)], args=fields)
+
+def save(quiz_id: int, user_id: int, key, changes: dict[int, Optional[int]]) -> tuple[int, int, Optional[int]]:
+    """Record answers ({question_id: option_id}) in the draft hash and mark it for the next flush.
+
+    The running partial score and answered count are adjusted by delta inside redis.
+    Returns (partial_score, answered_count, submission_id).
+    """
+    draft_key = _draft_key(quiz_id, user_id)
+    args = [current_app.config.get("ANSWER_DRAFT_TTL", 172800), _member(quiz_id, user_id)]
+    for qid, oid in changes.items():
+        args += [str(qid), _encode(oid, key.points_for(qid, oid))]
+
+    for _ in range(_SAVE_ATTEMPTS):
+        saved = _SAVE(keys=[draft_key, _DIRTY], args=args)
+        if saved is not None:
+            partial, count, sub_id = saved
+            return int(partial), int(count), int(sub_id) if sub_id else None
+        _seed(quiz_id, user_id, key)
+    raise RuntimeError(f"answer draft {draft_key} expired again right after seeding")
+
+def get_draft(quiz_id: int, user_id: int) -> Optional[Draft]:
+    data = redis_client.hgetall(_draft_key(quiz_id, user_id))
+    if not data:
+        return None
+    return _to_draft(data)
+
+def get_answers(quiz_id: int, user_id: int) -> Optional[dict[int, Optional[int]]]:
+    draft = get_draft(quiz_id, user_id)
+    return draft.answers if draft else None
+
+def _discard(quiz_id: int, user_id: int) -> None:
+    pipe = redis_client.pipeline()
+    pipe.delete(_draft_key(quiz_id, user_id))
+    pipe.srem(_DIRTY, _member(quiz_id, user_id))
+    pipe.execute()
+
+def discard_after_commit(quiz_id: int, user_id: int) -> None:
+    after_commit(_discard, quiz_id, user_id)
+
+def flush_drafts(batch_size: Optional[int] = None) -> int:
+    """Write dirty draft hashes into QuizSubmission.answers, one upsert per batch."""
+    batch_size = batch_size or current_app.config.get("ANSWER_DRAFT_FLUSH_BATCH", 500)
+    flushed = 0
+    while True:
+        members = redis_client.spop(_DIRTY, batch_size)
+        if not members:
+            return flushed
+
+        pipe = redis_client.pipeline()
+        for m in members:
+            quiz_id, user_id = m.split(":")
+            pipe.hgetall(_draft_key(int(quiz_id), int(user_id)))
+        results = pipe.execute()
+
+        rows = []
+        for m, data in zip(members, results):
+            if not data:
+                continue  # submitted or expired since it was marked
+            quiz_id, user_id = m.split(":")
+            draft = _to_draft(data)
+            rows.append({
+                "quiz_id": int(quiz_id),
+                "user_id": int(user_id),
+                "answers": {str(k): v for k, v in draft.answers.items()},
+                "partial_score": draft.partial_score,
+                "answered_count": draft.answered_count,
+            })
+
+        try:
+            submission_repo.upsert_draft_answers(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            redis_client.sadd(_DIRTY, *members)
+            raise
+
+        flushed += len(rows)
+        if len(members) < batch_size:
+            current_app.logger.info("flushed %s answer drafts", flushed)
+            return flushed
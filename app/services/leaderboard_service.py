@@ -12,21 +12,74 @@ from ..extensions import db
 from ..models import Quiz, QuizQuestion, QuizOption, QuizSubmission, User
 from ..services import quiz_service
 from ..repos.leaderboard_repo import LeaderboardRepo
+from . import leaderboard_snapshot, live_leaderboard
+from ..utils.cursor import encode_cursor
 
 lb_repo = LeaderboardRepo()
 
 
-def get_quiz_leaderboard(quiz_id: int, limit: int = 10, offset: int = 0, user_id: int | None = None):
-    rows, total = lb_repo.quiz_leaderboard_rows(quiz_id,limit, offset)
+def _next_cursor(items: list[dict], limit: int, *keys: str, total: int | None = None) -> str | None:
+    # board cursors also carry the last rank and the total so later pages need not count them again
+    if not items or len(items) < limit:
+        return None
+    last = items[-1]
+    values = [last[k] for k in keys]
+    if total is not None:
+        values.append(total)
+    return encode_cursor(values)
+
+def _quiz_seek_values(after: list | None):
+    if after is None:
+        return None
+    score, submitted_at, user_id, rank, total = after
+    try:
+        return int(score), datetime.fromisoformat(submitted_at), int(user_id), int(rank), int(total)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+def get_quiz_leaderboard(
+        quiz_id: int, limit: int = 10, offset: int = 0, user_id: int | None = None, after: list | None = None):
+    """Quiz board page by `offset`, or by keyset when `after` (a decoded cursor) is given."""
+    seek = _quiz_seek_values(after)
+    if leaderboard_snapshot.version(quiz_id) is not None:
+        leaderboard, total = leaderboard_snapshot.page(quiz_id, limit, offset, seek)
+        return {
+            "quiz_id": quiz_id,
+            "leaderboard": leaderboard,
+            "current_user": leaderboard_snapshot.user_entry(quiz_id, user_id) if user_id is not None else None,
+            "total": total,
+            "next_cursor": _next_cursor(leaderboard, limit, "score", "submitted_at", "user_id", "rank", total=total),
+        }
+
+    title = live_leaderboard.ready_title(quiz_id)
+    if title is not None:
+        start = offset if seek is None else live_leaderboard.position_after(quiz_id, seek[2])
+        if start is not None:
+            entries, total = live_leaderboard.page(quiz_id, limit, start)
+            leaderboard = [dict(e, title=title) for e in entries]
+            cur_user = live_leaderboard.user_entry(quiz_id, user_id) if user_id is not None else None
+            return {
+                "quiz_id": quiz_id,
+                "leaderboard": leaderboard,
+                "current_user": cur_user,
+                "total": total,
+                "next_cursor": _next_cursor(leaderboard, limit, "score", "submitted_at", "user_id", "rank", total=total),
+            }
+
+    if seek is None:
+        rows, total = lb_repo.quiz_leaderboard_rows(quiz_id,limit, offset)
+        ranked = [(r, r.rank) for r in rows]
+    else:
+        ranked, total = lb_repo.quiz_leaderboard_rows_after(quiz_id, seek, limit)
     
     leaderboard=[{
         "user_id": r.user_id,
         "username": r.username,
         "score": r.score,
         "submitted_at": r.submitted_at.isoformat() if r.submitted_at else None,
-        "rank": int(r.rank),
+        "rank": int(rank),
         "title": r.title,
-    } for r in rows]
+    } for r, rank in ranked]
 
     cur_user = None
     if user_id is not None:
@@ -39,18 +92,41 @@ def get_quiz_leaderboard(quiz_id: int, limit: int = 10, offset: int = 0, user_id
                 "submitted_at": r.submitted_at.isoformat() if r.submitted_at else None,
                 "rank": r.rank
             }
-    return {"quiz_id": quiz_id, "leaderboard": leaderboard, "current_user": cur_user, "total": total}
+    return {
+        "quiz_id": quiz_id,
+        "leaderboard": leaderboard,
+        "current_user": cur_user,
+        "total": total,
+        "next_cursor": _next_cursor(leaderboard, limit, "score", "submitted_at", "user_id", "rank", total=total),
+    }
 
-def get_week_leaderboard(week_start:date, limit: int = 10, offset: int = 0, user_id: int | None = None):
+def rebuild_quiz_leaderboard(quiz_id: int) -> int:
+    return live_leaderboard.rebuild(quiz_id)
+
+def quiz_leaderboard_version(quiz_id: int) -> datetime | None:
+    """Freeze time of a closed quiz's board (its ETag source); None while the board is still live."""
+    return leaderboard_snapshot.version(quiz_id)
+
+def week_quiz_id(week_start: date) -> int:
     q = quiz_service.get_quiz_by_week(quiz_service.week_monday(week_start))
     if not q:
         raise ValueError("Quiz not found for that week")
-    return get_quiz_leaderboard(q.id, limit=limit, offset=offset, user_id=user_id)
+    return q.id
+
+def get_week_leaderboard(
+        week_start:date, limit: int = 10, offset: int = 0, user_id: int | None = None, after: list | None = None):
+    return get_quiz_leaderboard(week_quiz_id(week_start), limit=limit, offset=offset, user_id=user_id, after=after)
 
 def list_past_quizzes_with_my_placement(
-        user_id: Optional[int], limit: int = 20, offset: int = 0
+        user_id: Optional[int], limit: int = 20, offset: int = 0, after: list | None = None
 ):
-    rows, total = lb_repo.past_quizzes_with_my_placement(user_id, limit, offset)
+    seek = None
+    if after is not None:
+        try:
+            seek = (date.fromisoformat(after[0]), int(after[1]))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+    rows, total = lb_repo.past_quizzes_with_my_placement(user_id, limit, offset, after=seek)
 
     items = []
 
@@ -73,25 +149,34 @@ def list_past_quizzes_with_my_placement(
             if r.my_rank is not None
             else None
         )
-    items.append(item)
+        items.append(item)
 
     return{
-        "title": item.title,
         "limit": int(limit),
         "offset": int(offset),
         "total": total,
         "items": items,
+        "next_cursor": _next_cursor(items, limit, "week_start_date", "quiz_id"),
     }
 
-def get_all_time_leaderboard(limit: int = 50, offset: int = 0, user_id: Optional[int] = None):
-    rows, total = lb_repo.all_time_rows(limit, offset)
+def get_all_time_leaderboard(
+        limit: int = 50, offset: int = 0, user_id: Optional[int] = None, after: list | None = None):
+    if after is None:
+        rows, total = lb_repo.all_time_rows(limit, offset)
+        ranked = [(r, r.rank) for r in rows]
+    else:
+        try:
+            seek = (int(after[0]), datetime.fromisoformat(after[1]), int(after[2]), int(after[3]), int(after[4]))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+        ranked, total = lb_repo.all_time_rows_after(seek, limit)
 
     leaderboard = [{
         "user_id": r.user_id,
         "username": r.username,
         "points": int(r.points or 0),
-        "rank": int (r.rank),
-    } for r in rows]
+        "rank": int (rank),
+    } for r, rank in ranked]
 
     cur_user = None
     if user_id is not None:
@@ -111,4 +196,9 @@ def get_all_time_leaderboard(limit: int = 50, offset: int = 0, user_id: Optional
         "total": total,
         "limit": int(limit),
         "offset": int(offset),
+        "next_cursor": (
+            encode_cursor([ranked[-1][0].points, ranked[-1][0].created_at, ranked[-1][0].user_id,
+                           int(ranked[-1][1]), total])
+            if len(ranked) == limit else None
+        ),
     }
\ No newline at end of file
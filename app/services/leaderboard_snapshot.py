@@ -0,0 +1,52 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+from typing import Optional
+from flask import current_app
+from ..repos.leaderboard_repo import LeaderboardRepo
+
+lb_repo = LeaderboardRepo()
+
+# submits that passed the window check just before closes_at get this long to commit before the board freezes
+FREEZE_GRACE = timedelta(seconds=30)
+
+def freeze(quiz_id: int) -> int:
+    written = lb_repo.write_quiz_snapshot(quiz_id)
+    current_app.logger.info("froze leaderboard for quiz %s (%s entries)", quiz_id, written)
+    return written
+
+def refresh(quiz_id: int) -> None:
+    """Rewrite the snapshot after moderation or a rescore; quizzes that were never frozen are left alone."""
+    state = lb_repo.snapshot_state(quiz_id)
+    if state and state.leaderboard_frozen_at is not None:
+        freeze(quiz_id)
+
+def version(quiz_id: int) -> Optional[datetime]:
+    """When the quiz's board was frozen; None until the close job (quiz_close.close_quiz) has frozen it."""
+    state = lb_repo.snapshot_state(quiz_id)
+    if not state:
+        raise ValueError("Quiz not found")
+    return state.leaderboard_frozen_at
+
+def _entry(r, title: str | None = None) -> dict:
+    entry = {
+        "user_id": r.user_id,
+        "username": r.username,
+        "score": r.score,
+        "submitted_at": r.submitted_at.isoformat() if r.submitted_at else None,
+        "rank": r.rank,
+    }
+    if title is not None:
+        entry["title"] = title
+    return entry
+
+def page(quiz_id: int, limit: int, offset: int, after: tuple | None = None) -> tuple[list[dict], int]:
+    if after is None:
+        rows, total = lb_repo.snapshot_rows(quiz_id, limit, offset)
+    else:
+        rows, total = lb_repo.snapshot_rows_after(quiz_id, after, limit)
+    title = lb_repo.quiz_title(quiz_id)
+    return [_entry(r, title) for r in rows], total
+
+def user_entry(quiz_id: int, user_id: int) -> Optional[dict]:
+    r = lb_repo.snapshot_user_row(quiz_id, user_id)
+    return _entry(r) if r else None
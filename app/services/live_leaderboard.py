@@ -0,0 +1,217 @@
+from __future__ import annotations
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from flask import current_app
+from ..extensions import redis_client
+from ..repos.leaderboard_repo import LeaderboardRepo
+
+lb_repo = LeaderboardRepo()
+
+# every board member has sorted-set score 0 and is a fixed-width string, so the lexicographic member
+# order is the SQL order: score desc, submitted_at asc (microseconds), user_id asc. Its first part is
+# the (score, submitted_at) tie; a second set holds the distinct ties so ZRANK there + 1 is the same
+# dense_rank the SQL and snapshot paths compute. tie counts say when a tie's last member leaves.
+_SCORE_SPAN = 10 ** 12
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_UID_WIDTH = 12
+
+# Lua sees a member's tie as everything before ":<user id>"
+_TIE_OF = f"""
+local function tie_of(m) return string.sub(m, 1, #m - {_UID_WIDTH + 1}) end
+local function drop(m)
+  redis.call('ZREM', KEYS[1], m)
+  local tie = tie_of(m)
+  if redis.call('HINCRBY', KEYS[3], tie, -1) <= 0 then
+    redis.call('HDEL', KEYS[3], tie)
+    redis.call('ZREM', KEYS[2], tie)
+  end
+end
+"""
+
+# KEYS: board, ties, tie counts, members, meta. ARGV: user id, member, meta json
+_PUT = redis_client.register_script(_TIE_OF + """
+local old = redis.call('HGET', KEYS[4], ARGV[1])
+if old ~= ARGV[2] then
+  if old then drop(old) end
+  local tie = tie_of(ARGV[2])
+  redis.call('ZADD', KEYS[1], 0, ARGV[2])
+  redis.call('ZADD', KEYS[2], 0, tie)
+  redis.call('HINCRBY', KEYS[3], tie, 1)
+  redis.call('HSET', KEYS[4], ARGV[1], ARGV[2])
+end
+redis.call('HSET', KEYS[5], ARGV[1], ARGV[3])
+return 1
+""")
+
+# same KEYS; ARGV: user ids
+_REMOVE = redis_client.register_script(_TIE_OF + """
+for i = 1, #ARGV do
+  local old = redis.call('HGET', KEYS[4], ARGV[i])
+  if old then
+    drop(old)
+    redis.call('HDEL', KEYS[4], ARGV[i])
+  end
+  redis.call('HDEL', KEYS[5], ARGV[i])
+end
+return #ARGV
+""")
+
+# KEYS: board, ties. ARGV: start, stop. Returns {total, dense rank of the first member, members}
+_PAGE = redis_client.register_script(_TIE_OF + """
+local members = redis.call('ZRANGE', KEYS[1], ARGV[1], ARGV[2])
+local first = 0
+if #members > 0 then first = redis.call('ZRANK', KEYS[2], tie_of(members[1])) + 1 end
+return {redis.call('ZCARD', KEYS[1]), first, members}
+""")
+
+# KEYS: board, ties, tie counts, members. ARGV: user id. Returns {position, dense rank, member} or nil
+_POSITION = redis_client.register_script(_TIE_OF + """
+local m = redis.call('HGET', KEYS[4], ARGV[1])
+if not m then return false end
+local pos = redis.call('ZRANK', KEYS[1], m)
+if not pos then return false end
+return {pos, redis.call('ZRANK', KEYS[2], tie_of(m)) + 1, m}
+""")
+
+# the lock holds a per-run token so a rebuild that outlived it never deletes the next one's
+_RELEASE = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+""")
+
+def _lb_key(quiz_id: int) -> str:
+    return f"lb:quiz:{quiz_id}:board"
+
+def _ties_key(quiz_id: int) -> str:
+    return f"lb:quiz:{quiz_id}:ties"
+
+def _tie_counts_key(quiz_id: int) -> str:
+    return f"lb:quiz:{quiz_id}:tie_counts"
+
+def _members_key(quiz_id: int) -> str:
+    return f"lb:quiz:{quiz_id}:members"     # user id -> board member
+
+def _meta_key(quiz_id: int) -> str:
+    return f"lb:quiz:{quiz_id}:meta"
+
+def _ready_key(quiz_id: int) -> str:
+    return f"lb:quiz:{quiz_id}:live"     # value is the quiz title
+
+def _rebuild_lock_key(quiz_id: int) -> str:
+    return f"lb:quiz:{quiz_id}:rebuild"
+
+def _legacy_keys(quiz_id: int) -> list[str]:
+    # the whole-second board and its ready flag, from before members carried the tie
+    return [f"lb:quiz:{quiz_id}", f"lb:quiz:{quiz_id}:ready"]
+
+def _keys(quiz_id: int) -> list[str]:
+    return [_lb_key(quiz_id), _ties_key(quiz_id), _tie_counts_key(quiz_id), _members_key(quiz_id), _meta_key(quiz_id)]
+
+def _member(score: int, submitted_at: datetime, user_id: int) -> str:
+    micros = (submitted_at - _EPOCH) // timedelta(microseconds=1)
+    return f"{_SCORE_SPAN - 1 - int(score):012d}:{micros:017d}:{int(user_id):0{_UID_WIDTH}d}"
+
+def _tie(member: str) -> str:
+    return member[:-(_UID_WIDTH + 1)]
+
+def _meta(username: str, score: int, submitted_at: datetime) -> str:
+    return json.dumps({"username": username, "score": int(score), "submitted_at": submitted_at.isoformat()})
+
+def record(quiz_id: int, user_id: int, username: str, score: int, submitted_at: datetime) -> None:
+    if submitted_at.tzinfo is None:
+        submitted_at = submitted_at.replace(tzinfo=timezone.utc)
+    _PUT(keys=_keys(quiz_id), args=[user_id, _member(score, submitted_at, user_id),
+                                     _meta(username, score, submitted_at)])
+
+def remove(quiz_id: int, user_id: int) -> None:
+    _REMOVE(keys=_keys(quiz_id), args=[user_id])
+
+def rebuild(quiz_id: int) -> int:
+    """Load a quiz's leaderboard from Postgres into redis. Returns the number of entries written.
+
+    Entries are upserted and excluded users removed rather than swapping in a fresh key,
+    so submits recorded while the rebuild runs are not lost.
+    """
+    title = lb_repo.quiz_title(quiz_id)
+    if title is None:
+        return 0
+
+    written = 0
+    pipe = redis_client.pipeline(transaction=False)
+    for r in lb_repo.quiz_entries(quiz_id):
+        record_at = r.submitted_at if r.submitted_at.tzinfo else r.submitted_at.replace(tzinfo=timezone.utc)
+        _PUT(keys=_keys(quiz_id), args=[r.user_id, _member(r.score, record_at, r.user_id),
+                                         _meta(r.username, r.score, record_at)], client=pipe)
+        written += 1
+        if written % 1000 == 0:
+            pipe.execute()
+    excluded = lb_repo.quiz_excluded_user_ids(quiz_id)
+    if excluded:
+        _REMOVE(keys=_keys(quiz_id), args=excluded, client=pipe)
+    pipe.delete(*_legacy_keys(quiz_id))
+    pipe.set(_ready_key(quiz_id), title)
+    pipe.execute()
+    current_app.logger.info("rebuilt live leaderboard for quiz %s (%s entries)", quiz_id, written)
+    return written
+
+def ready_title(quiz_id: int) -> Optional[str]:
+    """The quiz title when the live leaderboard can serve reads, else None (callers fall back to Postgres).
+
+    A missing board is never rebuilt on the request path; ensure_built does that from the scheduler.
+    """
+    return redis_client.get(_ready_key(quiz_id))
+
+def ensure_built(quiz_id: int) -> int:
+    """Rebuild the board when it is not ready and no other worker is already at it. Returns entries written."""
+    if redis_client.exists(_ready_key(quiz_id)):
+        return 0
+    token = uuid.uuid4().hex
+    lock_seconds = current_app.config.get("LIVE_LEADERBOARD_REBUILD_LOCK_SECONDS", 600)
+    if not redis_client.set(_rebuild_lock_key(quiz_id), token, nx=True, ex=lock_seconds):
+        return 0
+    try:
+        return rebuild(quiz_id)
+    finally:
+        _RELEASE(keys=[_rebuild_lock_key(quiz_id)], args=[token])
+
+def _entries(quiz_id: int, members: list[str], first_rank: int) -> list[dict]:
+    if not members:
+        return []
+    user_ids = [int(m[-_UID_WIDTH:]) for m in members]
+    metas = redis_client.hmget(_meta_key(quiz_id), user_ids)
+    entries, rank, prev = [], first_rank, None
+    for uid, member, raw in zip(user_ids, members, metas):
+        tie = _tie(member)
+        if prev is not None and tie != prev:
+            rank += 1
+        prev = tie
+        meta = json.loads(raw) if raw else {}
+        entries.append({
+            "user_id": uid,
+            "username": meta.get("username"),
+            "score": meta.get("score"),
+            "submitted_at": meta.get("submitted_at"),
+            "rank": rank,
+        })
+    return entries
+
+def page(quiz_id: int, limit: int, offset: int) -> tuple[list[dict], int]:
+    total, first_rank, members = _PAGE(keys=[_lb_key(quiz_id), _ties_key(quiz_id)], args=[offset, offset + limit - 1])
+    return _entries(quiz_id, members, int(first_rank)), int(total)
+
+def _position(quiz_id: int, user_id: int):
+    return _POSITION(keys=_keys(quiz_id)[:4], args=[user_id])
+
+def user_entry(quiz_id: int, user_id: int) -> Optional[dict]:
+    found = _position(quiz_id, user_id)
+    if not found:
+        return None
+    _pos, rank, member = found
+    return _entries(quiz_id, [member], int(rank))[0]
+
+def position_after(quiz_id: int, user_id: int) -> Optional[int]:
+    """Offset of the entry following `user_id`, or None when that user is no longer on the board."""
+    found = _position(quiz_id, user_id)
+    return None if not found else int(found[0]) + 1
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import json, random, time, uuid
+from flask import current_app
+from flask_mail import Message
+from ..extensions import mail, redis_client
+
+# request handlers push messages onto a redis list; the scheduler drains it over one SMTP connection.
+# A message moves to the sending list while it is in flight, so a sender that dies mid-batch loses nothing.
+_QUEUE = "mail:outbox"
+_SENDING = "mail:outbox:sending"
+_RETRY = "mail:outbox:retry"        # zset: message -> epoch seconds when it is due again
+_DEAD = "mail:outbox:dead"
+_LOCK = "mail:outbox:lock"
+_PAUSED = "mail:outbox:paused"              # set while backing off after SMTP connection failures
+_CONNECT_FAILURES = "mail:outbox:connect_failures"
+
+# move retries that are due back onto the queue
+_PROMOTE = redis_client.register_script("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, m in ipairs(due) do
+  redis.call('ZREM', KEYS[1], m)
+  redis.call('LPUSH', KEYS[2], m)
+end
+return #due
+""")
+
+# the lock holds a per-run token so only its owner can extend or release it
+_EXTEND = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+""")
+_RELEASE = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+""")
+
+def enqueue(subject: str, recipients: list[str], body: str) -> str:
+    """Queue a plain-text message for the background sender. Returns the message id."""
+    message_id = uuid.uuid4().hex
+    redis_client.lpush(_QUEUE, json.dumps({
+        "id": message_id, "subject": subject, "recipients": recipients, "body": body, "attempts": 0,
+    }))
+    return message_id
+
+def _backoff(attempts: int) -> float:
+    base = current_app.config.get("MAIL_RETRY_BASE_SECONDS", 30)
+    return min(base * 2 ** (attempts - 1), 3600) * random.uniform(0.8, 1.2)
+
+def _failed(raw: str, item: dict, error: Exception) -> None:
+    item["attempts"] += 1
+    item["error"] = str(error)
+    pipe = redis_client.pipeline()
+    pipe.lrem(_SENDING, 1, raw)
+    if item["attempts"] >= current_app.config.get("MAIL_MAX_ATTEMPTS", 6):
+        current_app.logger.error("mail %s to %s dropped after %s attempts: %s",
+                                 item["id"], item["recipients"], item["attempts"], error)
+        pipe.lpush(_DEAD, json.dumps(item))
+        pipe.ltrim(_DEAD, 0, 999)
+    else:
+        current_app.logger.warning("mail %s to %s failed (attempt %s): %s",
+                                   item["id"], item["recipients"], item["attempts"], error)
+        pipe.zadd(_RETRY, {json.dumps(item): time.time() + _backoff(item["attempts"])})
+    pipe.execute()
+
+def _connect_failed(sent: int) -> None:
+    failures = redis_client.incr(_CONNECT_FAILURES)
+    redis_client.expire(_CONNECT_FAILURES, 24 * 3600)
+    pause = max(1, int(_backoff(failures)))
+    redis_client.set(_PAUSED, "1", ex=pause)
+    current_app.logger.exception("mail outbox: SMTP connection failed after %s messages (%s in a row); pausing %ss",
+                                 sent, failures, pause)
+
+def send_pending(limit: int | None = None) -> int:
+    """Send up to `limit` queued messages over a single SMTP connection. Returns how many were sent.
+
+    Only one sender runs at a time across workers; the others return 0. The lock is extended after
+    every message and the run stops as soon as it is lost, so an expired lock never lets two senders
+    (and the crash recovery of the second) work on the same messages.
+    """
+    limit = limit or current_app.config.get("MAIL_OUTBOX_BATCH", 100)
+    lock_ms = current_app.config.get("MAIL_OUTBOX_LOCK_SECONDS", 120) * 1000
+    if redis_client.exists(_PAUSED):
+        return 0
+    token = uuid.uuid4().hex
+    if not redis_client.set(_LOCK, token, nx=True, px=lock_ms):
+        return 0
+    try:
+        # whatever is still on the sending list was left there by a sender that died
+        while redis_client.lmove(_SENDING, _QUEUE, "RIGHT", "RIGHT") is not None:
+            pass
+        _PROMOTE(keys=[_RETRY, _QUEUE], args=[time.time(), limit])
+        if not redis_client.llen(_QUEUE):
+            return 0
+
+        sent = 0
+        started = time.perf_counter()
+        try:
+            with mail.connect() as conn:
+                redis_client.delete(_CONNECT_FAILURES)
+                while sent < limit:
+                    if not _EXTEND(keys=[_LOCK], args=[token, lock_ms]):
+                        current_app.logger.warning("mail outbox: lost the sender lock after %s messages", sent)
+                        break
+                    raw = redis_client.lmove(_QUEUE, _SENDING, "RIGHT", "LEFT")
+                    if raw is None:
+                        break
+                    item = json.loads(raw)
+                    try:
+                        conn.send(Message(item["subject"], recipients=item["recipients"], body=item["body"]))
+                    except Exception as e:
+                        _failed(raw, item, e)
+                        continue
+                    redis_client.lrem(_SENDING, 1, raw)
+                    sent += 1
+        except Exception:
+            # connecting (or the connection itself) failed; anything in flight goes back to the queue next run
+            _connect_failed(sent)
+        if sent:
+            current_app.logger.info("mail outbox: sent %s messages in %.1f ms",
+                                    sent, (time.perf_counter() - started) * 1000)
+        return sent
+    finally:
+        _RELEASE(keys=[_LOCK], args=[token])
+
+def depth() -> dict:
+    pipe = redis_client.pipeline()
+    pipe.llen(_QUEUE)
+    pipe.llen(_SENDING)
+    pipe.zcard(_RETRY)
+    pipe.llen(_DEAD)
+    queued, sending, retrying, dead = pipe.execute()
+    return {"queued": queued, "sending": sending, "retrying": retrying, "dead": dead}
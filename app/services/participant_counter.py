@@ -0,0 +1,51 @@
+from __future__ import annotations
+from flask import current_app
+from ..extensions import redis_client
+from ..repos.participation_repo import ParticipationRepo
+from ..utils.tx import after_commit
+
+participation_repo = ParticipationRepo()
+
+_TTL = 30 * 24 * 3600
+
+# only adjust a seeded hash: a HINCRBY on a missing key would start from 0 instead of the real count
+_ADJUST = redis_client.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+for i = 1, #ARGV, 2 do
+  redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+""")
+
+def _key(quiz_id: int) -> str:
+    return f"quiz:{quiz_id}:participants"     # hash: joined, submitted
+
+def _adjust(quiz_id: int, *deltas) -> None:
+    _ADJUST(keys=[_key(quiz_id)], args=list(deltas))
+
+def joined_after_commit(quiz_id: int) -> None:
+    after_commit(_adjust, quiz_id, "joined", 1)
+
+def submitted_after_commit(quiz_id: int) -> None:
+    after_commit(_adjust, quiz_id, "joined", -1, "submitted", 1)
+
+def reconcile(quiz_id: int) -> tuple[int, int]:
+    """Overwrite the counters with the Postgres counts. Returns (joined, submitted)."""
+    joined = participation_repo.count_by_status(quiz_id, "joined")
+    submitted = participation_repo.count_by_status(quiz_id, "submitted")
+    pipe = redis_client.pipeline()
+    pipe.hset(_key(quiz_id), mapping={"joined": joined, "submitted": submitted})
+    pipe.expire(_key(quiz_id), _TTL)
+    pipe.execute()
+    current_app.logger.debug("reconciled participants for quiz %s: %s joined, %s submitted", quiz_id, joined, submitted)
+    return joined, submitted
+
+def counts(quiz_id: int) -> tuple[int, int]:
+    data = redis_client.hmget(_key(quiz_id), ["joined", "submitted"])
+    if data[0] is None or data[1] is None:
+        return reconcile(quiz_id)
+    return int(data[0]), int(data[1])
+
+def total(quiz_id: int) -> int:
+    joined, submitted = counts(quiz_id)
+    return max(joined, 0) + max(submitted, 0)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+import json, threading, time
+from collections import OrderedDict
+from typing import Callable, Optional
+from flask import current_app
+from ..extensions import redis_client
+from ..utils.tx import after_commit
+
+_local: "OrderedDict[tuple, object]" = OrderedDict()
+_local_lock = threading.Lock()
+
+# versions are wall-clock millis so a flushed redis never hands out a version a worker already cached
+_BUMP_VERSION = redis_client.register_script("""
+local cur = tonumber(redis.call('GET', KEYS[1]) or '0')
+local nxt = math.max(cur + 1, tonumber(ARGV[1]))
+redis.call('SET', KEYS[1], nxt)
+return nxt
+""")
+
+def _version_key(quiz_id: int) -> str:
+    return f"quiz:{quiz_id}:version"
+
+def _entry_key(quiz_id: int, version: int, kind: str) -> str:
+    return f"quiz:{quiz_id}:v{version}:{kind}"
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+def get_version(quiz_id: int) -> int:
+    key = _version_key(quiz_id)
+    version = redis_client.get(key)
+    if version is None:
+        redis_client.set(key, _now_ms(), nx=True)
+        version = redis_client.get(key)
+    return int(version)
+
+def bump_version(quiz_id: int) -> int:
+    return int(_BUMP_VERSION(keys=[_version_key(quiz_id)], args=[_now_ms()]))
+
+def _bump_and_prime(quiz_id: int, prime: dict) -> None:
+    version = bump_version(quiz_id)
+    ttl = current_app.config.get("QUIZ_CACHE_TTL", 3600)
+    for kind, value in prime.items():
+        redis_client.setex(_entry_key(quiz_id, version, kind), ttl, json.dumps(value))
+
+def invalidate(quiz_id: int, prime: Optional[dict] = None) -> None:
+    """Bump the quiz version once the current transaction commits.
+
+    `prime` maps cache kinds to payloads that were built inside the transaction;
+    they are stored under the new version so the first reader does not rebuild them.
+    """
+    after_commit(_bump_and_prime, quiz_id, prime or {})
+
+def _local_get(key: tuple):
+    with _local_lock:
+        value = _local.get(key)
+        if value is not None:
+            _local.move_to_end(key)
+        return value
+
+def _local_put(key: tuple, value) -> None:
+    limit = current_app.config.get("QUIZ_CACHE_LOCAL_SIZE", 256)
+    with _local_lock:
+        _local[key] = value
+        _local.move_to_end(key)
+        while len(_local) > limit:
+            _local.popitem(last=False)
+
+def get_or_build(
+        quiz_id: int, kind: str, build: Callable[[], Optional[dict]], decode: Optional[Callable] = None):
+    """Return the cached `kind` payload for the current version of a quiz, building it on a miss.
+
+    `build` returns a json-able dict (or None when the quiz does not exist). When `decode`
+    is given the worker-local copy holds the decoded object instead of the raw dict.
+    Cached values are shared between requests and must be treated as read-only.
+    """
+    version = get_version(quiz_id)
+    local_key = (quiz_id, version, kind)
+    value = _local_get(local_key)
+    if value is not None:
+        return value
+
+    redis_key = _entry_key(quiz_id, version, kind)
+    raw = redis_client.get(redis_key)
+    if raw is not None:
+        value = json.loads(raw)
+    else:
+        value = build()
+        if value is None:
+            return None
+        redis_client.setex(redis_key, current_app.config.get("QUIZ_CACHE_TTL", 3600), json.dumps(value))
+
+    if decode is not None:
+        value = decode(value)
+    _local_put(local_key, value)
+    return value
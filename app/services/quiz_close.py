@@ -0,0 +1,65 @@
+from __future__ import annotations
+import time
+from flask import current_app
+from ..extensions import db
+from ..repos.leaderboard_repo import LeaderboardRepo
+from ..repos.submission_repo import SubmissionRepo
+from . import draft_buffer, leaderboard_snapshot, live_leaderboard, participant_counter
+from .answer_key import POINTS_BY_DIFF
+from .quiz_service import day_bonus
+
+lb_repo = LeaderboardRepo()
+submission_repo = SubmissionRepo()
+
+def finalize_drafts(quiz_id: int, batch_size: int | None = None, sleep_ms: int | None = None) -> tuple[int, int]:
+    """Submit every answered draft of a closed quiz as of its closes_at, one committed chunk at a time.
+
+    Safe to rerun or to run from several workers at once: only rows still unsubmitted are touched.
+    Returns (drafts finalized, points credited).
+    """
+    state = lb_repo.snapshot_state(quiz_id)
+    if not state:
+        raise ValueError("Quiz not found")
+    batch_size = batch_size or current_app.config.get("BATCH_MUTATION_SIZE", 5000)
+    sleep_ms = current_app.config.get("BATCH_MUTATION_SLEEP_MS", 50) if sleep_ms is None else sleep_ms
+
+    if draft_buffer.enabled():
+        # answers still sitting in redis must reach quiz_submission before they are scored
+        draft_buffer.flush_drafts()
+
+    at, bonus = state.closes_at, day_bonus(state.closes_at)
+    started = time.perf_counter()
+    after_id, total, points, chunks = 0, 0, 0, 0
+    while True:
+        chunk_started = time.perf_counter()
+        last_id, done, credited = submission_repo.finalize_drafts_chunk(
+            quiz_id, after_id, batch_size, at, bonus, POINTS_BY_DIFF)
+        db.session.commit()
+        if last_id is None:
+            break
+        after_id = last_id
+        total += done
+        points += credited
+        chunks += 1
+        current_app.logger.info("finalize quiz %s: chunk %s, %s drafts in %.1f ms (%s so far)",
+                                quiz_id, chunks, done, (time.perf_counter() - chunk_started) * 1000, total)
+        if sleep_ms:
+            time.sleep(sleep_ms / 1000)
+
+    current_app.logger.info("finalize quiz %s: %s drafts submitted, %s points credited in %.1f s",
+                            quiz_id, total, points, time.perf_counter() - started)
+    return total, points
+
+def close_quiz(quiz_id: int) -> int:
+    """Close-time pipeline: finalize drafts, then rebuild the counters, live board and snapshot from Postgres.
+
+    Returns the number of drafts finalized.
+    """
+    finalized, _ = finalize_drafts(quiz_id)
+    participant_counter.reconcile(quiz_id)
+    if finalized:
+        live_leaderboard.rebuild(quiz_id)
+    # (re)written even when a read froze the board before the drafts were in
+    leaderboard_snapshot.freeze(quiz_id)
+    db.session.commit()
+    return finalized
@@ -1,25 +1,28 @@
 from __future__ import annotations
-from calendar import weekday
+import json
 from datetime import datetime, date, timedelta, timezone
-from typing import Iterable, Optional
+from typing import Optional
 from psycopg2 import IntegrityError
-from sqlalchemy import String, select, func
-from sqlalchemy.orm import selectinload
+from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.schemas.quiz import QuestionPublicSchema
-from app.services.token_service import delete_all_for_user, revoke_all_for_user
+from app.services.token_service import delete_all_for_user
 from ..extensions import db
-from ..models import Quiz, QuizQuestion, QuizOption, QuizSubmission, User
+from ..models import Quiz, QuizQuestion, QuizOption
+from ..repos.participation_repo import ParticipationRepo
 from ..repos.quiz_repo import QuizRepo
 from ..repos.submission_repo import SubmissionRepo
 from ..repos.user_repo import UserRepo
+from . import quiz_cache, draft_buffer, leaderboard_snapshot, live_leaderboard, participant_counter
+from ..utils.tx import after_commit
+from .answer_key import AnswerKey, POINTS_BY_DIFF, get_answer_key
 
+participation_repo = ParticipationRepo()
 quiz_repo = QuizRepo()
 submission_repo = SubmissionRepo()
 user_repo = UserRepo()
 
-POINTS_BY_DIFF = {"easy": 5, "medium": 10, "hard":20}
 CATEGORIES = {"science", "art", "history", "sport"}
 
 def week_monday(d:date)->date:
@@ -78,6 +81,7 @@ def publish_quiz(quiz_id:int, when: datetime | None = None) -> None:
     if not quiz:
         raise ValueError("Quiz not found")
     quiz_repo.set_published_at(quiz, when or func.now())
+    quiz_cache.invalidate(quiz_id, prime={"answer_key": AnswerKey.from_quiz(quiz).to_dict()})
 
 def finish_quiz(quiz_id:int, when: datetime | None = None) -> None:
 
@@ -90,76 +94,111 @@ def finish_quiz(quiz_id:int, when: datetime | None = None) -> None:
     if now > quiz.closes_at:
         raise ValueError("Quiz already finished")
     quiz_repo.set_closes_at(quiz, when or func.now())
+    quiz_cache.invalidate(quiz_id)
 
 def score_answers(quiz: Quiz, answers: dict[int, int]) -> int:
-    total = 0
-    answers = {int(k):(int(v) if v is not None else None) for k,v in (answers or {}).items()}
-    correct_map = {q.id: {o.id for o in q.options if o.is_correct} for q in quiz.questions}
-    points_by_qid = {q.id: int(POINTS_BY_DIFF.get(q.difficulty, q.points or 0)) for q in quiz.questions}
-    
-    for qid, oid in answers.items():
-        if qid in correct_map and oid in correct_map[qid]:
-            total += points_by_qid.get(qid,0)
-    return total
+    return AnswerKey.from_quiz(quiz).score(answers)
+
+def day_bonus(when: datetime) -> int:
+    # mirrored in SubmissionRepo.rescore_quiz as 7 - ISODOW(submitted_at)
+    return 6 - when.weekday()
+
+def _is_open(window, now: datetime) -> bool:
+    return bool(window.published_at and window.opens_at <= now <= window.closes_at)
+
+def _refusal(quiz_id: int, user_id: int, now: datetime, action: str) -> Optional[ValueError]:
+    """Why a guarded join/submit matched nothing, in the order the checks were always reported.
+
+    None for a join that found the user already joined.
+    """
+    d = participation_repo.diagnose(quiz_id, user_id)
+    if d.user_id is None:
+        return ValueError("User not found")
+    if action == "join":
+        if d.status == "submitted":
+            return ValueError("user already submitted this quiz")
+        if d.user_status == "warned":
+            return ValueError("user has a timeout for quizzes. timeout until", d.timeout_until)
+        if d.user_status == "banned":
+            return ValueError("user banned from this application")
+        if d.quiz_id is None:
+            return ValueError("Quiz not found")
+        if now >= d.closes_at:
+            return ValueError("Quiz finished")
+        if d.status == "joined":
+            return None
+        return ValueError("Join failed, please retry")
+
+    # a submit that lost the race to a concurrent one sees the winner's committed rows here
+    if d.submitted_at is not None:
+        return ValueError("Already submitted")
+    if d.timeout:
+        return ValueError("user has a timeout for quizzes. timeout until", d.timeout_until)
+    if d.user_status == "banned":
+        return ValueError("user banned from this application")
+    if d.status != "joined":
+        return ValueError("User not joined or already submit this quiz")
+    if d.quiz_id is None:
+        return ValueError("Quiz not found")
+    if not _is_open(d, now):
+        return ValueError("Quiz not opened yet")
+    return ValueError("Submit failed, please retry")
+
+def submit_quiz(*, quiz_id: int, user_id: int):
+    """Submit in one guarded statement; returns the (id, score, submitted_at, username) row."""
+    now = datetime.now(timezone.utc)
+    draft = draft_buffer.get_draft(quiz_id, user_id) if draft_buffer.enabled() else None
+    overrides = {}
+    if draft is not None:
+        overrides = {
+            "answers": json.dumps({str(k): v for k, v in draft.answers.items()}),
+            "partial_score": draft.partial_score,
+            "answered_count": draft.answered_count,
+        }
 
-def submit_quiz(*, quiz_id: int, user_id: int) -> QuizSubmission:
-    user = user_repo.get_user_by_id(user_id)
+    sub = participation_repo.submit(quiz_id, user_id, now, day_bonus(now), **overrides)
+    if sub is None:
+        raise _refusal(quiz_id, user_id, now, "submit")
 
-    if not user:
-        raise ValueError("User not found")
-    if user.timeout:
-        raise ValueError("user has a timeout for quizzes. timeout until", user.timeout_until)
-    if user.user_status == "banned":
-        raise ValueError("user banned from this application")
-    if not user.join_status == "joined":
-        raise ValueError("User not joined or already submit this quiz")
+    if draft is not None:
+        draft_buffer.discard_after_commit(quiz_id, user_id)
+    participant_counter.submitted_after_commit(quiz_id)
+    after_commit(live_leaderboard.record, quiz_id, user_id, sub.username, sub.score, sub.submitted_at)
+    return sub
 
-    quiz = quiz_repo.get_with_question(quiz_id)
-    if not quiz:
+def rescore_quiz(quiz_id: int, corrections: list[dict] | None = None) -> dict:
+    """Apply is_correct corrections and rescore every submission of a closed quiz in bulk."""
+    window = quiz_repo.get_window(quiz_id)
+    if not window:
         raise ValueError("Quiz not found")
-    now = datetime.now(timezone.utc)
+    if datetime.now(timezone.utc) < window.closes_at:
+        raise ValueError("Quiz is still open, rescore after it closes")
 
-    if not(quiz.published_at and quiz.opens_at <= now <= quiz.closes_at):
-        raise ValueError("Quiz not opened yet")
-    
-    sub = submission_repo.get_for_user(quiz_id, user_id)
-    if sub and sub.submitted_at:
-        raise ValueError("Already submitted")
-    if not sub:
-        sub = submission_repo.add_draft(quiz_id,user_id)
-    
-    answers_norm = {int(k): (int(v) if v is not None else None) for k, v in (sub.answers or {}).items()}
-
-    sub.answers = answers_norm
-    final_score = score_answers(quiz, sub.answers or {})
-    day_bonus = 6 - datetime.now().weekday()
-    total = final_score + day_bonus
+    for c in corrections or []:
+        if not quiz_repo.set_option_correct(quiz_id, c["option_id"], c["is_correct"]):
+            raise ValueError(f"Option {c['option_id']} not found in this quiz")
+    if corrections:
+        quiz_cache.invalidate(quiz_id)
 
-    submission_repo.submit_quiz(sub, func.now(), total)
-    user_repo.add_points(user_id, total)
-    user_repo.update_join_status(user, "submitted")
-    user_repo.update_score(user, total)
-
-    return sub
+    rescored, points_delta = submission_repo.rescore_quiz(quiz_id, POINTS_BY_DIFF)
+    leaderboard_snapshot.refresh(quiz_id)
+    return {"quiz_id": quiz_id, "rescored": rescored, "points_delta": points_delta}
 
 def join_quiz(user_id:int, quiz_id:int):
-    user = user_repo.get_user_by_id(user_id)
-    if not user:
-        raise ValueError ("User not found")
-    if user.join_status == "submitted":
-        raise ValueError("user already submitted this quiz")
-    if user.user_status == "warned":
-        raise ValueError("user has a timeout for quizzes. timeout until", user.timeout_until)
-    if user.user_status == "banned":
-        raise ValueError("user banned from this application")
-    quiz = quiz_repo.get_by_id(quiz_id)
-    if not quiz:
-        raise ValueError("Quiz not found")
-    if not quiz.opens_at:
-        raise ValueError("Quiz not opened yet")
-    if datetime.now(timezone.utc) >= quiz.closes_at:
-        raise ValueError("Quiz finished")
-    user_repo.update_join_status(user, "joined")
+    now = datetime.now(timezone.utc)
+    if participation_repo.join(quiz_id, int(user_id), now):
+        participant_counter.joined_after_commit(quiz_id)
+        return
+    refusal = _refusal(quiz_id, int(user_id), now, "join")
+    if refusal is not None:
+        raise refusal
+
+def get_join_status(user_id: int, now: datetime | None = None) -> str:
+    """The user's status on the active quiz; not_joined when no quiz is open."""
+    quiz_id = quiz_repo.get_active_id(now or datetime.now(timezone.utc))
+    if quiz_id is None:
+        return "not_joined"
+    return participation_repo.get_status(quiz_id, user_id) or "not_joined"
 
 def delete_question(quiz_id: int, question_id:int):
     quiz = quiz_repo.get_by_id(quiz_id)
@@ -173,6 +212,7 @@ def delete_question(quiz_id: int, question_id:int):
         raise ValueError("Question not found")
     
     db.session.delete(qq)
+    quiz_cache.invalidate(quiz_id)
 
 def edit_quiz(quiz_id: int, question_id: int, data:dict) -> QuizQuestion:
     quiz = quiz_repo.get_by_id(quiz_id)
@@ -214,6 +254,7 @@ def edit_quiz(quiz_id: int, question_id: int, data:dict) -> QuizQuestion:
                 is_correct=bool(op.get("is_correct",False))
             ))
 
+    quiz_cache.invalidate(quiz_id)
     return qq
      
 
@@ -259,51 +300,126 @@ def add_question(quiz_id: int, data:dict) -> QuizQuestion:
                 raise ValueError("each option needs text")
             quiz_repo.add_option(QuizOption(question_id=qq.id,text= op["text"],is_correct=bool(op.get("is_correct", False))))
 
+        quiz_cache.invalidate(quiz_id)
         return qq
 
     except(ValueError, IntegrityError, SQLAlchemyError):
         db.session.rollback()
         raise
 
-def save_answer(*, quiz_id: int, user_id: int, question_id:int, option_id: Optional[int]) -> QuizSubmission:
-    user = user_repo.get_user_by_id(user_id)
-    if not user.join_status == "joined":
-        raise ValueError("User not joined on this quiz")
-    if user.join_status == "submitted":
+def _answer_key_for_saving(quiz_id: int, user_id: int) -> AnswerKey:
+    status = participation_repo.get_status(quiz_id, user_id)
+    if status == "submitted":
         raise ValueError("User already submitted this quiz")
-    quiz = quiz_repo.get_with_question(quiz_id)
-    if not quiz:
+    if status != "joined":
+        raise ValueError("User not joined on this quiz")
+    window = quiz_repo.get_window(quiz_id)
+    if not window:
         raise ValueError("Quiz not found")
     now = datetime.now(timezone.utc)
 
-    if not(quiz.published_at and quiz.opens_at <= now <= quiz.closes_at):
+    if not _is_open(window, now):
         raise ValueError("Quiz not opened yet")
-    
-    
-    if not quiz_repo.question_exists(quiz_id, question_id):
-        raise ValueError("Question not found")
-    
-    
-    if not quiz_repo.option_belongs(option_id, question_id):
-        raise ValueError("Option does not belong to this question")
+    return get_answer_key(quiz_id)
+
+def _answer_error(key: AnswerKey, question_id: int, option_id: Optional[int]) -> str | None:
+    if not key.has_question(question_id):
+        return "Question not found"
+    if not key.option_belongs(option_id, question_id):
+        return "Option does not belong to this question"
+    return None
+
+class VersionConflict(ValueError):
+    """The draft changed since the version the client sent; `current_version` is what it is now."""
+    def __init__(self, current_version: int):
+        super().__init__("Answers were changed by another request, reload and retry")
+        self.current_version = current_version
+
+# compare-and-swap attempts when the client did not pin a version
+SAVE_RETRIES = 3
+
+def _apply_answers(quiz_id: int, user_id: int, key: AnswerKey, changes: dict[int, Optional[int]],
+                   version: Optional[int] = None) -> dict:
+    """Apply `changes` to the user's draft with a compare-and-swap on its version.
+
+    With `version` the write only happens if the draft is still at it (VersionConflict otherwise);
+    without one a lost race is retried against the fresh row.
+    """
+    if draft_buffer.enabled():
+        partial, count, attempt_id = draft_buffer.save(quiz_id, user_id, key, changes)
+        return {"attempt_id": attempt_id, "answered_count": count, "partial_score": partial, "version": None}
     
     sub = submission_repo.get_for_user(quiz_id, user_id)
-    
-    if sub and sub.submitted_at:
-        raise ValueError("Already submitted, cannot change answers")
     if not sub:
         sub = submission_repo.add_draft(quiz_id, user_id)
 
-    answers = {int(k):(int(v) if v is not None else None)for k, v in (sub.answers or {}).items()}
-    answers[int(question_id)] = option_id
-    sub.answers = answers
-
-    points_map = {q.id: q.points for q in quiz.questions}
-    correct_map = {q.id: {o.id for o in q.options if o.is_correct} for q in quiz.questions}
-    partial = sum(points_map[qid] for qid, oid in answers.items() if oid in correct_map.get(qid, set()))
-
-
-    return {"attempt_id": sub.id, "answered_count": len(answers), "partial_score": partial}
+    for _ in range(SAVE_RETRIES):
+        if sub.submitted_at:
+            raise ValueError("Already submitted, cannot change answers")
+        if version is not None and sub.version != version:
+            raise VersionConflict(sub.version)
+
+        # only the changed questions are scored: old option out, new option in
+        answers = sub.answers or {}
+        partial, count = sub.partial_score or 0, sub.answered_count or 0
+        for qid, oid in changes.items():
+            field = str(qid)
+            if field in answers:
+                old = answers[field]
+                partial -= key.points_for(qid, int(old) if old is not None else None)
+            else:
+                count += 1
+            partial += key.points_for(qid, oid)
+
+        new_version = submission_repo.patch_answers(
+            sub.id, sub.version, {str(qid): oid for qid, oid in changes.items()},
+            partial_score=partial, answered_count=count,
+        )
+        if new_version is not None:
+            return {"attempt_id": sub.id, "answered_count": count, "partial_score": partial, "version": new_version}
+        db.session.refresh(sub)
+    raise VersionConflict(sub.version)
+
+def save_answer(*, quiz_id: int, user_id: int, question_id:int, option_id: Optional[int],
+                version: Optional[int] = None) -> dict:
+    key = _answer_key_for_saving(quiz_id, user_id)
+    error = _answer_error(key, question_id, option_id)
+    if error:
+        raise ValueError(error)
+    return _apply_answers(quiz_id, user_id, key, {int(question_id): option_id}, version)
+
+def save_answers(*, quiz_id: int, user_id: int, items: list[dict], version: Optional[int] = None) -> dict:
+    """Validate every {question_id, option_id} pair in one pass and apply the valid ones together.
+
+    Invalid items are reported per item and do not block the rest of the batch.
+    """
+    key = _answer_key_for_saving(quiz_id, user_id)
+
+    results: list[dict] = []
+    changes: dict[int, Optional[int]] = {}
+    for item in items:
+        qid = int(item["question_id"])
+        oid = int(item["option_id"]) if item.get("option_id") is not None else None
+        error = _answer_error(key, qid, oid)
+        if error:
+            results.append({"question_id": qid, "option_id": oid, "ok": False, "error": error})
+            continue
+        changes[qid] = oid
+        results.append({"question_id": qid, "option_id": oid, "ok": True})
+
+    if changes:
+        summary = _apply_answers(quiz_id, user_id, key, changes, version)
+    else:
+        draft = draft_buffer.get_draft(quiz_id, user_id) if draft_buffer.enabled() else None
+        sub = submission_repo.get_for_user(quiz_id, user_id) if draft is None else None
+        summary = {
+            "attempt_id": draft.submission_id if draft else (sub.id if sub else None),
+            "answered_count": draft.answered_count if draft else (sub.answered_count if sub else 0),
+            "partial_score": draft.partial_score if draft else (sub.partial_score if sub else 0),
+            "version": None if draft else (sub.version if sub else None),
+        }
+    summary["results"] = results
+    return summary
 
 def get_my_answers(quiz_id: int, user_id: int, now: datetime|None = None) -> dict:
     now = now or datetime.now(timezone.utc)
@@ -394,6 +510,8 @@ def warn_user(user_id: int, quiz_id:int) -> None:
 
     sub = submission_repo.get_for_user(quiz_id, user_id) or submission_repo.add_draft(quiz_id,user_id)
     submission_repo.set_action_snapshot(sub, action_time=datetime.now(timezone.utc), user_status="warned")
+    leaderboard_snapshot.refresh(quiz_id)
+    after_commit(live_leaderboard.remove, quiz_id, user_id)
 
 def ban_user(user_id: int, quiz_id:int) -> None:
     now = datetime.now(timezone.utc)
@@ -407,6 +525,8 @@ def ban_user(user_id: int, quiz_id:int) -> None:
     
     sub = submission_repo.get_for_user(quiz_id, user_id) or submission_repo.add_draft(quiz_id,user_id)
     submission_repo.set_action_snapshot(sub, action_time=datetime.now(timezone.utc), user_status="banned")
+    leaderboard_snapshot.refresh(quiz_id)
+    after_commit(live_leaderboard.remove, quiz_id, user_id)
 
 def _quiz_to_paper_admin(quiz: Quiz) -> dict:
     return {
@@ -454,23 +574,31 @@ def _quiz_to_paper_user(quiz:Quiz)->dict:
         ]
     }
 
-def get_quiz_for_user(quiz_id: int)->dict:
+def _build_paper(quiz_id: int, to_paper) -> dict | None:
     q = quiz_repo.get_with_question(quiz_id)
-    if not q:
+    return to_paper(q) if q else None
+
+def get_quiz_for_user(quiz_id: int)->dict:
+    paper = quiz_cache.get_or_build(quiz_id, "paper_user", lambda: _build_paper(quiz_id, _quiz_to_paper_user))
+    if not paper:
         raise ValueError("quiz not found")
-    return _quiz_to_paper_user(q)
+    return paper
 
 def get_quiz_for_admin(quiz_id: int)->dict:
-    q = quiz_repo.get_with_question(quiz_id)
-    if not q:
+    paper = quiz_cache.get_or_build(quiz_id, "paper_admin", lambda: _build_paper(quiz_id, _quiz_to_paper_admin))
+    if not paper:
         raise ValueError("quiz not found")
-    return _quiz_to_paper_admin(q)
+    return paper
+
+def get_active_quiz_paper(now: datetime | None = None) -> dict | None:
+    now = now or datetime.now(timezone.utc)
+    quiz_id = quiz_repo.get_active_id(now)
+    if quiz_id is None:
+        return None
+    return get_quiz_for_user(quiz_id)
 
 def get_total_user_for_quiz(quiz_id:int):
-    joined_users = user_repo.count_joined_current()
-    submitted = user_repo.count_submitted_current(quiz_id)
-    total = joined_users + submitted
-    return total
+    return participant_counter.total(quiz_id)
 
 def get_question_for_user(quiz_id: int, order_no: int) -> dict:
     qq = quiz_repo.get_question_by_order(quiz_id, order_no)
@@ -490,6 +618,14 @@ def get_question_for_user(quiz_id: int, order_no: int) -> dict:
         "max_order": max_order,
     }
 
+def get_current_answers(quiz_id: int, user_id: int) -> dict | None:
+    if draft_buffer.enabled():
+        buffered = draft_buffer.get_answers(quiz_id, user_id)
+        if buffered is not None:
+            return buffered
+    sub = submission_repo.get_for_user(quiz_id, user_id)
+    return (sub.answers or {}) if sub else None
+
 def get_answer_count(quiz_id: int, answers: dict) -> int:
     quiz = quiz_repo.get_by_id(quiz_id)
     if not quiz:
@@ -1,21 +1,22 @@
 from __future__ import annotations
 from hmac import compare_digest
-import time
+import time, uuid
 from typing import Optional
-from sqlalchemy import delete, func, or_
+from sqlalchemy import func
 
-from app.repos.user_repo import UserRepo
-from ..extensions import db
 from ..models import RefreshToken
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from flask import current_app
 from flask_jwt_extended import create_refresh_token, create_access_token
 from ..utils.security import hash_refresh_token
+from ..utils.batching import batched_mutation
+from ..utils.tx import after_commit
+from ..utils import allow_cache, token_epoch
 from flask_jwt_extended.utils import decode_token
 from ..repos.token_repo import TokenRepo
 from ..extensions import redis_client
 
 token_repo = TokenRepo()
-user_repo = UserRepo()
 def _ensure_refresh_claims(raw_token: str) -> dict:
     claims = decode_token(raw_token)
     typ = claims.get("type") or claims.get("token_type")
@@ -31,9 +32,37 @@ def _device_label(device: Optional[str]):
 def _acc_allow(jti:str) -> str: 
     return f"acc:allow:{jti}"
 
+def _ref_live(jti:str) -> str:
+    return f"ref:live:{jti}"
+
 def _ttl_from_exp(exp_t:int) -> int:
     return max(int(exp_t-time.time()),1)
 
+def _new_claims(expires_config_key: str) -> dict:
+    # picked here rather than by flask-jwt-extended so the fresh token never has to be decoded again
+    expires = current_app.config[expires_config_key]
+    seconds = expires.total_seconds() if isinstance(expires, timedelta) else int(expires)
+    return {"jti": str(uuid.uuid4()), "exp": int(time.time() + seconds)}
+
+def _mark_refresh_live(jti: str, user_id: int, exp: int) -> None:
+    redis_client.setex(_ref_live(jti), _ttl_from_exp(exp), user_id)
+
+def _mark_refresh_live_later(jti: str, user_id: int, exp: int, pipe=None) -> None:
+    # with a pipe the caller executes it once the transaction has committed
+    if pipe is not None:
+        pipe.setex(_ref_live(jti), _ttl_from_exp(exp), user_id)
+    else:
+        after_commit(_mark_refresh_live, jti, user_id, exp)
+
+def _forget_refresh(*jtis: str) -> None:
+    # drop now so the token stops passing immediately, and again after commit in case a
+    # concurrent blocklist miss re-warmed it from the not-yet-committed row
+    if not jtis:
+        return
+    keys = [_ref_live(j) for j in jtis]
+    redis_client.delete(*keys)
+    after_commit(redis_client.delete, *keys)
+
 def user_has_active_refresh_token(user_id: int)->bool:
     return token_repo.has_active_for_user(user_id)
 
@@ -51,14 +80,24 @@ def store_refresh_token(user_id: int, raw_token:str, user_device: str |None)->Re
         expires_at=exp_date,
         device=_device_label(user_device),
     )
+    after_commit(_mark_refresh_live, jti, user_id, claims["exp"])
     return row
 
-def issue_refresh_token(user_id: int, user_device: str | None)->tuple[str,RefreshToken]:
-    token = create_refresh_token(identity = user_id)
-    row = store_refresh_token(user_id, token, user_device)
+def issue_refresh_token(user_id: int, user_device: str | None, pipe=None)->tuple[str,RefreshToken]:
+    claims = _new_claims("JWT_REFRESH_TOKEN_EXPIRES")
+    token = create_refresh_token(identity = user_id, additional_claims=claims)
+    row = token_repo.upsert_refresh(
+        jti=claims["jti"],
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.fromtimestamp(claims["exp"], tz=timezone.utc),
+        device=_device_label(user_device),
+    )
+    _mark_refresh_live_later(claims["jti"], user_id, claims["exp"], pipe)
     return token, row
 
 def revoke_refresh_by_jti(jti:str)->bool:
+    _forget_refresh(jti)
     return token_repo.revoke_by_jti(jti, when=datetime.now(timezone.utc))
 
 def revoke_refresh_by_raw(raw_token:str, expected_user_id: Optional[int] = None) -> bool:
@@ -76,28 +115,70 @@ def revoke_refresh_by_raw(raw_token:str, expected_user_id: Optional[int] = None)
         raise ValueError("Token does not match stored hash.")
 
     row.revoked_at = datetime.now(timezone.utc)
+    _forget_refresh(jti)
     return True
 
 def revoke_all_for_user(user_id: int) -> int:
-    return token_repo.revoke_all_for_user(user_id, when= func.now())
+    """Revoke every refresh token of the user and, through the epoch, every access token."""
+    jtis = token_repo.revoke_all_for_user(user_id, when= func.now())
+    _forget_refresh(*jtis)
+    token_epoch.bump(user_id)
+    return len(jtis)
 
 def delete_refresh_by_jti(jti: str) -> None:
+    _forget_refresh(jti)
     return token_repo.delete_by_jti(jti)
 
-def delete_all_for_user(user_id:int) -> None:
-    return token_repo.delete_all_for_user(user_id)
+def delete_all_for_user(user_id:int) -> int:
+    jtis = token_repo.delete_all_for_user(user_id)
+    _forget_refresh(*jtis)
+    token_epoch.bump(user_id)
+    return len(jtis)
+
+def rotate_refresh_token(
+        old_jti: str, user_id: int, user_device: str | None, pipe=None) -> tuple[str, bool] | None:
+    """Replace a live refresh token with a fresh one in a single UPDATE ... RETURNING.
+
+    Returns (new_refresh_token, is_admin), or None when the old token is no longer valid.
+    With `pipe`, the redis liveness writes are queued on it for the caller to run after commit.
+    """
+    device = _device_label(user_device)
+    claims = _new_claims("JWT_REFRESH_TOKEN_EXPIRES")
+    token = create_refresh_token(identity=user_id, additional_claims={**claims, "device": device})
+    role = token_repo.rotate(
+        old_jti,
+        user_id,
+        jti=claims["jti"],
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.fromtimestamp(claims["exp"], tz=timezone.utc),
+        device=device,
+    )
+    if role is None:
+        return None
+    if pipe is not None:
+        pipe.delete(_ref_live(old_jti))
+    else:
+        _forget_refresh(old_jti)
+    _mark_refresh_live_later(claims["jti"], user_id, claims["exp"], pipe)
+    return token, role == "admin"
+
+def cleanup_tokens() -> int:
+    # chunked and committed per chunk; one unbounded DELETE bloats WAL and holds up autovacuum
+    return batched_mutation(
+        "cleanup-refresh-tokens", RefreshToken.__table__, token_repo.expired_or_revoked(), key=RefreshToken.jti
+    )
 
-def cleanup_tokens():
-    token_repo.cleanup_expired_or_revoked()
+def mint_access_and_allow(identity: int, *, is_admin: bool, fresh: bool= False, pipe=None) -> str:
+    """Create an access token for a user whose role the caller already knows, and allowlist its jti.
 
-def mint_access_and_allow(identity: int, claims:dict | None = None, fresh: bool= False) -> str:
-    user = user_repo.get_user_by_id(identity)
-    claims = {"is_admin": bool(user.is_admin)}
-    token = create_access_token(identity=identity, additional_claims = claims or {}, fresh=fresh)
-    decode = decode_token(token)
-    jti, exp = decode["jti"], decode["exp"]
-    redis_client.setex(_acc_allow(jti), _ttl_from_exp(exp), identity)
+    Pass `pipe` to queue the allowlist write with the caller's other redis writes; the caller executes it.
+    """
+    claims = {**_new_claims("JWT_ACCESS_TOKEN_EXPIRES"), "is_admin": bool(is_admin), "ep": token_epoch.current(identity)}
+    token = create_access_token(identity=identity, additional_claims = claims, fresh=fresh)
+    if current_app.config.get("ACCESS_TOKEN_ALLOWLIST", True):
+        (pipe if pipe is not None else redis_client).setex(_acc_allow(claims["jti"]), _ttl_from_exp(claims["exp"]), identity)
     return token
 
 def revoke_access_token(jti:str) -> None:
-    redis_client.delete(_acc_allow(jti))
\ No newline at end of file
+    redis_client.delete(_acc_allow(jti))
+    allow_cache.invalidate(jti)
\ No newline at end of file
@@ -0,0 +1,118 @@
+from __future__ import annotations
+import os, threading, time
+from collections import OrderedDict
+from flask import current_app
+from ..extensions import redis_client
+
+# per-worker memo of what redis recently said about access tokens: allowed jtis (positive answers only)
+# and per-user token epochs ("ep:<user_id>"). Entries live well under a second, and revocations and
+# epoch bumps are pushed to every worker over pub/sub.
+CHANNEL = "acc:revoked"
+
+_cache: "OrderedDict[str, tuple]" = OrderedDict()   # key -> (monotonic expiry, value)
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_listener = {"pid": None, "thread": None, "retry_at": 0.0}
+_start_lock = threading.Lock()
+_RETRY_SECONDS = 5.0     # after a failed subscribe the cache stays bypassed this long before trying again
+
+def _acc_allow(jti: str) -> str:
+    return f"acc:allow:{jti}"
+
+def _enabled() -> bool:
+    return bool(current_app.config.get("ACCESS_ALLOW_CACHE"))
+
+def _drop(jti: str) -> None:
+    with _lock:
+        if _cache.pop(jti, None) is not None:
+            _stats["invalidations"] += 1
+
+def _on_message(message) -> None:
+    _drop(message["data"])
+
+def _listening() -> bool:
+    # started lazily so each forked worker gets its own subscriber; without one the cache is bypassed
+    thread = _listener["thread"]
+    if _listener["pid"] == os.getpid() and thread is not None and thread.is_alive():
+        return True
+    if time.monotonic() < _listener["retry_at"]:
+        return False
+    if not _start_lock.acquire(blocking=False):
+        return False        # another thread of this worker is subscribing
+    try:
+        thread = _listener["thread"]
+        if _listener["pid"] == os.getpid() and thread is not None and thread.is_alive():
+            return True
+        with _lock:
+            _cache.clear()
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{CHANNEL: _on_message})
+            _listener["thread"] = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+            _listener["pid"] = os.getpid()
+        except Exception:
+            _listener["retry_at"] = time.monotonic() + _RETRY_SECONDS
+            current_app.logger.exception("access allow cache: could not subscribe to %s; retrying in %ss",
+                                         CHANNEL, _RETRY_SECONDS)
+            return False
+        return True
+    finally:
+        _start_lock.release()
+
+def _recall(key: str):
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return entry[1]
+        _stats["misses"] += 1
+        return None
+
+def _remember(key: str, value) -> None:
+    ttl = current_app.config.get("ACCESS_ALLOW_CACHE_TTL_MS", 500) / 1000
+    limit = current_app.config.get("ACCESS_ALLOW_CACHE_SIZE", 10000)
+    with _lock:
+        _cache[key] = (time.monotonic() + ttl, value)
+        _cache.move_to_end(key)
+        while len(_cache) > limit:
+            _cache.popitem(last=False)
+
+def active() -> bool:
+    """Whether lookups go through this worker's memo (enabled and subscribed)."""
+    return _enabled() and _listening()
+
+def _cached(key: str, load):
+    if not active():
+        return load()
+    value = _recall(key)
+    if value is None:
+        value = load()
+        if value:
+            _remember(key, value)
+    return value
+
+def is_allowed(jti: str) -> bool:
+    return bool(_cached(jti, lambda: redis_client.exists(_acc_allow(jti))))
+
+def epoch(user_id, load) -> int:
+    """The user's current token epoch, from this worker's memo or `load()`."""
+    return int(_cached(f"ep:{user_id}", load))
+
+def invalidate(key: str) -> None:
+    """Forget a jti (or "ep:<user_id>") here and tell every other worker to do the same."""
+    _drop(key)
+    redis_client.publish(CHANNEL, key)
+
+def stats() -> dict:
+    with _lock:
+        size = len(_cache)
+        counters = dict(_stats)
+    lookups = counters["hits"] + counters["misses"]
+    return {
+        "enabled": _enabled(),
+        "size": size,
+        **counters,
+        "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else None,
+    }
@@ -0,0 +1,68 @@
+from __future__ import annotations
+import json
+import time
+from flask import current_app
+from sqlalchemy import delete, literal_column, select, update
+from ..extensions import db, redis_client
+
+_CURSOR_TTL = 24 * 3600
+
+def _cursor_key(name: str) -> str:
+    return f"batch:{name}:cursor"
+
+def batched_mutation(name: str, table, where, *, values: dict | None = None, key=None,
+                     batch_size: int | None = None, sleep_ms: int | None = None) -> int:
+    """DELETE (or UPDATE ... SET `values`) the rows of `table` matching `where`, one committed chunk at a time.
+
+    With `key` (a unique, orderable column, normally the primary key) chunks are key ranges and
+    the last finished key is kept in redis, so an interrupted run resumes where it stopped.
+    Without it chunks are ctid lists; `where` must stop matching once a row is mutated.
+    Returns the number of rows mutated.
+    """
+    batch_size = batch_size or current_app.config.get("BATCH_MUTATION_SIZE", 5000)
+    sleep_ms = current_app.config.get("BATCH_MUTATION_SLEEP_MS", 50) if sleep_ms is None else sleep_ms
+    row_id = key if key is not None else literal_column("ctid")
+
+    last = None
+    if key is not None:
+        saved = redis_client.get(_cursor_key(name))
+        if saved is not None:
+            last = json.loads(saved)
+            current_app.logger.info("%s: resuming after %r", name, last)
+
+    started = time.perf_counter()
+    total, chunks = 0, 0
+    while True:
+        chunk_started = time.perf_counter()
+        ids_query = select(row_id).select_from(table).where(where).limit(batch_size)
+        if key is not None:
+            if last is not None:
+                ids_query = ids_query.where(key > last)
+            ids_query = ids_query.order_by(key)
+        ids = db.session.execute(ids_query).scalars().all()
+        if not ids:
+            break
+
+        stmt = delete(table) if values is None else update(table).values(values)
+        # `where` is re-applied so rows changed since the id scan are left alone
+        done = db.session.execute(stmt.where(row_id.in_(ids), where)).rowcount
+        db.session.commit()
+
+        total += done
+        chunks += 1
+        if key is not None:
+            last = ids[-1]
+            redis_client.set(_cursor_key(name), json.dumps(last), ex=_CURSOR_TTL)
+        current_app.logger.info("%s: chunk %s, %s rows in %.1f ms (%s so far)",
+                                name, chunks, done, (time.perf_counter() - chunk_started) * 1000, total)
+
+        if len(ids) < batch_size:
+            break
+        if sleep_ms:
+            time.sleep(sleep_ms / 1000)
+
+    if key is not None:
+        redis_client.delete(_cursor_key(name))
+    current_app.logger.info("%s: finished, %s rows in %s chunks, %.1f s",
+                            name, total, chunks, time.perf_counter() - started)
+    return total
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import hashlib, json, uuid
+from functools import wraps
+from typing import Callable
+from flask import Response, current_app, request
+from flask_jwt_extended import get_jwt_identity
+from .responses import fail
+from ..extensions import redis_client
+
+HEADER = "Idempotency-Key"
+
+# one key per (user, Idempotency-Key): {"state": "pending"} while the first request runs, then the stored response
+def _idem_key(user_id, key: str) -> str:
+    return f"idem:{user_id}:{key}"
+
+def _fingerprint() -> str:
+    h = hashlib.sha256()
+    h.update(f"{request.method} {request.path}\n".encode())
+    h.update(request.get_data(cache=True))
+    return h.hexdigest()
+
+# the pending value carries a per-request token, so only the request holding the key may settle or drop it
+_RELEASE = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+""")
+_STORE = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3]) end
+return false
+""")
+
+# results a retry should really re-run: conflicts (e.g. version_conflict) and throttling, like 5xx
+_RETRYABLE = {409, 429}
+
+def _replay(entry: dict) -> Response:
+    resp = Response(entry["body"], status=entry["status"], headers=entry["headers"])
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+def _in_progress() -> Response:
+    resp = current_app.make_response(
+        fail("A request with this Idempotency-Key is still in progress", 409, code="idempotency_in_progress"))
+    resp.headers["Retry-After"] = "1"
+    return resp
+
+def _settled(key: str, fingerprint: str):
+    """The stored response for `key`, "pending" while it is in flight, or None once it is gone."""
+    raw = redis_client.get(key)
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    if entry["fp"] != fingerprint:
+        return fail("Idempotency-Key was already used for a different request", 422, code="idempotency_key_reused")
+    if entry["state"] == "pending":
+        return "pending"
+    return _replay(entry)
+
+def idempotent(fn: Callable):
+    """Serve client retries carrying the same Idempotency-Key from the first response.
+
+    Must sit below jwt_required (keys are per user) and above use_schema, so replays skip validation.
+    A duplicate that arrives while the first request still runs gets 409 with Retry-After at once
+    rather than holding a worker. 5xx, 409 and 429 responses and exceptions are not stored, so those
+    can be retried for real.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get(HEADER)
+        if not header:
+            return fn(*args, **kwargs)
+        if len(header) > 255:
+            return fail(f"{HEADER} is too long", 400)
+
+        key = _idem_key(get_jwt_identity(), header)
+        fingerprint = _fingerprint()
+        lock_ms = current_app.config.get("IDEMPOTENCY_LOCK_MS", 10000)
+        pending = json.dumps({"state": "pending", "fp": fingerprint, "token": uuid.uuid4().hex})
+
+        if not redis_client.set(key, pending, nx=True, px=lock_ms):
+            settled = _settled(key, fingerprint)
+            if settled == "pending":
+                return _in_progress()
+            if settled is not None:
+                return settled
+            # the first request failed or its lock expired in between: run this one
+            if not redis_client.set(key, pending, nx=True, px=lock_ms):
+                return _in_progress()
+
+        try:
+            resp = current_app.make_response(fn(*args, **kwargs))
+        except Exception:
+            _RELEASE(keys=[key], args=[pending])
+            raise
+        if resp.status_code >= 500 or resp.status_code in _RETRYABLE:
+            _RELEASE(keys=[key], args=[pending])
+            return resp
+        # nothing is stored when this request's lock expired and another request holds the key now
+        _STORE(keys=[key], args=[pending, json.dumps({
+            "state": "done", "fp": fingerprint, "status": resp.status_code,
+            "headers": [[k, v] for k, v in resp.headers.items() if k.lower() != "content-length"],
+            "body": resp.get_data(as_text=True),
+        }), current_app.config.get("IDEMPOTENCY_TTL", 3600)])
+        return resp
+    return wrapper
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import math, time
+from functools import wraps
+from typing import Callable, Optional, Tuple
+from flask import current_app, jsonify, request
+from ..extensions import redis_client
+
+# token buckets, all checked and charged atomically: a request costs one token from every bucket,
+# and is refused (nothing charged) when any bucket is empty. Returns the wait in ms, 0 when allowed.
+# ARGV: now_ms, then (capacity, refill per ms) for each key.
+_TAKE = redis_client.register_script("""
+local now = tonumber(ARGV[1])
+local wait = 0
+local tokens = {}
+for i = 1, #KEYS do
+  local cap, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+  local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local t = tonumber(b[1]) or cap
+  local ts = tonumber(b[2]) or now
+  t = math.min(cap, t + math.max(0, now - ts) * rate)
+  if t < 1 then wait = math.max(wait, math.ceil((1 - t) / rate)) end
+  tokens[i] = t
+end
+for i = 1, #KEYS do
+  local cap, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+  local t = tokens[i]
+  if wait == 0 then t = t - 1 end
+  redis.call('HSET', KEYS[i], 'tokens', t, 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], math.ceil(cap / rate))
+end
+return wait
+""")
+
+Limit = Tuple[int, int]     # (requests, per seconds)
+
+def _bucket_key(scope: str, kind: str, value: str) -> str:
+    return f"rl:{scope}:{kind}:{value}"
+
+def rate_limit(scope: str, *, ip: Optional[Limit] = None, field: Optional[Tuple[str, int, int]] = None) -> Callable:
+    """Throttle an endpoint per client IP and/or per a JSON body field (username, email...).
+
+    `ip=(20, 60)` allows bursts of 20 refilling at 20 per 60s; `field=("username", 5, 300)` does the
+    same per normalised field value. Refused requests get 429 with Retry-After.
+    Place it above use_schema so throttled requests are rejected before any parsing work.
+    """
+    def decorator(fn: Callable):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get("RATE_LIMIT_ENABLED", True):
+                return fn(*args, **kwargs)
+
+            keys, argv = [], []
+            if ip is not None:
+                keys.append(_bucket_key(scope, "ip", request.remote_addr or "unknown"))
+                argv += [ip[0], ip[0] / (ip[1] * 1000)]
+            if field is not None:
+                name, count, seconds = field
+                value = (request.get_json(silent=True) or {}).get(name)
+                if isinstance(value, str) and value.strip():
+                    keys.append(_bucket_key(scope, name, value.strip().lower()))
+                    argv += [count, count / (seconds * 1000)]
+            if not keys:
+                return fn(*args, **kwargs)
+
+            try:
+                wait_ms = int(_TAKE(keys=keys, args=[int(time.time() * 1000), *argv]))
+            except Exception:
+                current_app.logger.exception("rate limiter unavailable for %s; letting the request through", scope)
+                return fn(*args, **kwargs)
+            if wait_ms > 0:
+                resp = jsonify(error="Too many attempts. Please try again later.")
+                resp.headers["Retry-After"] = str(max(1, math.ceil(wait_ms / 1000)))
+                return resp, 429
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
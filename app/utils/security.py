@@ -1,23 +1,72 @@
-import bcrypt, hashlib
+import bcrypt, hashlib, multiprocessing, os, threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 from flask import current_app
 from app.repos.token_repo import TokenRepo
 from ..extensions import jwt, redis_client
+from . import allow_cache, token_epoch
 
 _repo = TokenRepo()
 
-def _acc_allow(jti:str) -> str: 
-    return f"acc:allow:{jti}"
+def _ref_live(jti:str) -> str:
+    return f"ref:live:{jti}"
+
+class PasswordHasherBusy(Exception):
+    """Every bcrypt slot is taken; the request should be retried shortly (served as 503)."""
+
+# bcrypt runs in a small process pool so a login burst cannot pin every request thread.
+# created lazily per worker process; the semaphore bounds running + queued jobs.
+_pool = {"pid": None, "executor": None, "slots": None}
+_pool_lock = threading.Lock()
+
+def _bcrypt_hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _bcrypt_check(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+def _executor():
+    with _pool_lock:
+        if _pool["pid"] != os.getpid():
+            size = current_app.config.get("BCRYPT_POOL_SIZE", 2)
+            _pool["executor"] = ProcessPoolExecutor(
+                max_workers=size, mp_context=multiprocessing.get_context("spawn")
+            ) if size > 0 else None
+            _pool["slots"] = threading.BoundedSemaphore(size + current_app.config.get("BCRYPT_MAX_PENDING", 16))
+            _pool["pid"] = os.getpid()
+        return _pool["executor"], _pool["slots"]
+
+def _run_bcrypt(fn, *args):
+    executor, slots = _executor()
+    if executor is None:
+        return fn(*args)
+    if not slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
 
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    rounds = current_app.config.get("BCRYPT_ROUNDS", 12)
+    return _run_bcrypt(_bcrypt_hash, password.encode('utf-8'), rounds).decode('utf-8')
 
 def check_password(hashed_password: str, user_password: str) -> bool:
     try:
-        return bcrypt.checkpw(user_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        return _run_bcrypt(_bcrypt_check, user_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except PasswordHasherBusy:
+        raise
     except Exception:
         return False
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    # "$2b$<cost>$<salt+hash>"
+    try:
+        cost = int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return False
+    return cost != current_app.config.get("BCRYPT_ROUNDS", 12)
+
 def hash_refresh_token(token: str) -> str:
     pepper = current_app.config.get('REFRESH_TOKEN_PEPPER', "")
     return hashlib.sha256((token + pepper).encode('utf-8')).hexdigest()
@@ -31,10 +80,21 @@ def init_jwt(app):
         jti = payload["jti"]
 
         if token_type == "access":
-            return not redis_client.exists(_acc_allow(jti))
+            ep = payload.get("ep")
+            allowlist = current_app.config.get("ACCESS_TOKEN_ALLOWLIST", True)
+            if ep is None:
+                return not allowlist or not allow_cache.is_allowed(jti)
+            return not token_epoch.access_ok(payload["sub"], ep, jti if allowlist else None)
         
         if token_type == "refresh":
+            if redis_client.exists(_ref_live(jti)):
+                return False
+            # miss: issued before the mirror existed or redis lost it; postgres decides and re-warms
             row = _repo.get_by_jti(jti)
-            return (row is None) or (row.revoked_at is not None)
+            if row is None or row.revoked_at is not None or row.expires_at <= datetime.now(timezone.utc):
+                return True
+            ttl = int((row.expires_at - datetime.now(timezone.utc)).total_seconds())
+            redis_client.setex(_ref_live(jti), max(ttl, 1), row.user_id)
+            return False
         
         return True
\ No newline at end of file
@@ -0,0 +1,60 @@
+from __future__ import annotations
+import time
+from ..extensions import redis_client
+from . import allow_cache
+
+# every access token carries the user's epoch as the "ep" claim; bumping the epoch kills all of them at once.
+# epochs are wall-clock millis so a flushed redis never reissues an epoch an old token carries.
+_BUMP = redis_client.register_script("""
+local cur = tonumber(redis.call('GET', KEYS[1]) or '0')
+local nxt = math.max(cur + 1, tonumber(ARGV[1]))
+redis.call('SET', KEYS[1], nxt)
+return nxt
+""")
+
+# the user's epoch, seeding it with now_ms on first use, and (with a second key) whether that allowlist key
+# exists: an access-token check is one round trip
+_CHECK = redis_client.register_script("""
+local epoch = redis.call('GET', KEYS[1])
+if not epoch then
+  epoch = ARGV[1]
+  redis.call('SET', KEYS[1], epoch)
+end
+local allowed = 1
+if KEYS[2] then allowed = redis.call('EXISTS', KEYS[2]) end
+return {tonumber(epoch), allowed}
+""")
+
+def _epoch_key(user_id) -> str:
+    return f"user:{user_id}:epoch"
+
+def _acc_allow(jti: str) -> str:
+    return f"acc:allow:{jti}"
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+def _load(user_id) -> int:
+    return int(_CHECK(keys=[_epoch_key(user_id)], args=[_now_ms()])[0])
+
+def current(user_id) -> int:
+    return allow_cache.epoch(user_id, lambda: _load(user_id))
+
+def bump(user_id) -> int:
+    epoch = int(_BUMP(keys=[_epoch_key(user_id)], args=[_now_ms()]))
+    allow_cache.invalidate(f"ep:{user_id}")
+    return epoch
+
+def is_current(user_id, epoch) -> bool:
+    return current(user_id) == int(epoch)
+
+def access_ok(user_id, epoch, jti: str | None = None) -> bool:
+    """The token's epoch is current and, when `jti` is given, its allowlist key exists.
+
+    Through the per-worker memo when it is active, otherwise a single redis call.
+    """
+    if allow_cache.active():
+        return is_current(user_id, epoch) and (jti is None or allow_cache.is_allowed(jti))
+    keys = [_epoch_key(user_id)] + ([_acc_allow(jti)] if jti is not None else [])
+    current_epoch, allowed = _CHECK(keys=keys, args=[_now_ms()])
+    return int(current_epoch) == int(epoch) and allowed == 1
@@ -0,0 +1,24 @@
+from __future__ import annotations
+from typing import Callable
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from ..extensions import db
+
+_CALLBACKS = "after_commit_callbacks"
+
+def after_commit(fn: Callable, *args, **kwargs) -> None:
+    # side effects (redis, caches) that must only happen once the db rows are visible
+    db.session.info.setdefault(_CALLBACKS, []).append((fn, args, kwargs))
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    for fn, args, kwargs in session.info.pop(_CALLBACKS, []):
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            current_app.logger.exception("after_commit callback %s failed", getattr(fn, "__name__", fn))
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit(session: Session) -> None:
+    session.info.pop(_CALLBACKS, None)
@@ -0,0 +1,37 @@
+"""leaderboard seek indexes
+
+Revision ID: a1c4e7b9d2f6
+Revises: f3b9d6e2a871
+Create Date: 2026-10-18 17:20:44.902315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c4e7b9d2f6'
+down_revision = 'f3b9d6e2a871'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # one ascending key per board so a (-score, submitted_at, user_id) > (...) row comparison is a single range seek
+    op.create_index(
+        'ix_quiz_submission_seek', 'quiz_submission',
+        ['quiz_id', sa.text('(-score)'), 'submitted_at', 'user_id'],
+        unique=False,
+        postgresql_where=sa.text('submitted_at IS NOT NULL'),
+    )
+    op.create_index(
+        'ix_users_points_seek', 'users',
+        [sa.text('(-points)'), 'created_at', 'id'],
+        unique=False,
+        postgresql_where=sa.text('points > 0'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_users_points_seek', table_name='users')
+    op.drop_index('ix_quiz_submission_seek', table_name='quiz_submission')
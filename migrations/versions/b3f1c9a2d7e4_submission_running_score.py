@@ -0,0 +1,42 @@
+"""submission running score
+
+Revision ID: b3f1c9a2d7e4
+Revises: 1fb44e1e4e6e
+Create Date: 2026-10-18 10:12:41.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1c9a2d7e4'
+down_revision = '1fb44e1e4e6e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('quiz_submission', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('partial_score', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('answered_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # backfill open drafts so submit can finalize the stored value
+    op.execute("""
+    UPDATE quiz_submission s
+    SET answered_count = (SELECT count(*) FROM jsonb_object_keys(s.answers)),
+        partial_score = COALESCE((
+            SELECT sum(CASE q.difficulty WHEN 'easy' THEN 5 WHEN 'medium' THEN 10 WHEN 'hard' THEN 20
+                       ELSE q.points END)
+            FROM jsonb_each_text(s.answers) a(question_id, option_id)
+            JOIN quiz_options o ON o.id = a.option_id::int AND o.question_id = a.question_id::int AND o.is_correct
+            JOIN quiz_questions q ON q.id = o.question_id AND q.quiz_id = s.quiz_id
+        ), 0)
+    WHERE s.submitted_at IS NULL
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('quiz_submission', schema=None) as batch_op:
+        batch_op.drop_column('answered_count')
+        batch_op.drop_column('partial_score')
@@ -0,0 +1,36 @@
+"""rank lookup indexes
+
+Revision ID: c7e2a4f9b1d3
+Revises: b3f1c9a2d7e4
+Create Date: 2026-10-18 11:02:17.554120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a4f9b1d3'
+down_revision = 'b3f1c9a2d7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_quiz_submission_rank', 'quiz_submission',
+        ['quiz_id', sa.text('score DESC'), 'submitted_at'],
+        unique=False,
+        postgresql_where=sa.text('submitted_at IS NOT NULL'),
+    )
+    op.create_index(
+        'ix_users_points_created_at', 'users',
+        [sa.text('points DESC'), 'created_at'],
+        unique=False,
+        postgresql_where=sa.text('points > 0'),
+    )
+
+
+def downgrade():
+    op.drop_index('ix_users_points_created_at', table_name='users')
+    op.drop_index('ix_quiz_submission_rank', table_name='quiz_submission')
@@ -0,0 +1,39 @@
+"""leaderboard snapshot
+
+Revision ID: d2e8b5c4a913
+Revises: c7e2a4f9b1d3
+Create Date: 2026-10-18 12:14:40.318275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2e8b5c4a913'
+down_revision = 'c7e2a4f9b1d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('quizzes', sa.Column('leaderboard_frozen_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_table(
+        'quiz_leaderboard_snapshot',
+        sa.Column('quiz_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('position', sa.Integer(), nullable=False),
+        sa.Column('rank', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(length=50), nullable=False),
+        sa.Column('score', sa.Integer(), nullable=False),
+        sa.Column('submitted_at', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['quiz_id'], ['quizzes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('quiz_id', 'user_id'),
+        sa.UniqueConstraint('quiz_id', 'position', name='uq_lb_snapshot_position'),
+    )
+
+
+def downgrade():
+    op.drop_table('quiz_leaderboard_snapshot')
+    op.drop_column('quizzes', 'leaderboard_frozen_at')
@@ -0,0 +1,71 @@
+"""quiz participation
+
+Revision ID: e5a7c3d1f284
+Revises: d2e8b5c4a913
+Create Date: 2026-10-18 13:05:52.640117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c3d1f284'
+down_revision = 'd2e8b5c4a913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'quiz_participation',
+        sa.Column('quiz_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('status', postgresql.ENUM(name='join_status', create_type=False), nullable=False, server_default='joined'),
+        sa.Column('joined_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.ForeignKeyConstraint(['quiz_id'], ['quizzes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('quiz_id', 'user_id'),
+    )
+    op.create_index('ix_quiz_participation_status', 'quiz_participation', ['quiz_id', 'status'], unique=False)
+
+    # every finished submission is a 'submitted' participation of its own quiz
+    op.execute("""
+    INSERT INTO quiz_participation (quiz_id, user_id, status, joined_at)
+    SELECT s.quiz_id, s.user_id, 'submitted', s.submitted_at
+    FROM quiz_submission s
+    WHERE s.submitted_at IS NOT NULL
+    ON CONFLICT (quiz_id, user_id) DO NOTHING
+    """)
+    # users.join_status only ever described the latest quiz
+    op.execute("""
+    INSERT INTO quiz_participation (quiz_id, user_id, status)
+    SELECT q.id, u.id, u.join_status
+    FROM users u
+    CROSS JOIN (SELECT id FROM quizzes WHERE opens_at <= now() ORDER BY opens_at DESC LIMIT 1) q
+    WHERE u.join_status IN ('joined', 'submitted')
+    ON CONFLICT (quiz_id, user_id) DO NOTHING
+    """)
+
+    with op.batch_alter_table('users') as b:
+        b.drop_index('ix_users_join_status')
+        b.drop_column('join_status')
+
+
+def downgrade():
+    with op.batch_alter_table('users') as b:
+        b.add_column(sa.Column('join_status', postgresql.ENUM(name='join_status', create_type=False),
+                               nullable=False, server_default='not_joined'))
+        b.create_index('ix_users_join_status', ['join_status'], unique=False)
+
+    op.execute("""
+    UPDATE users u
+    SET join_status = p.status
+    FROM quiz_participation p
+    WHERE p.user_id = u.id
+      AND p.quiz_id = (SELECT id FROM quizzes WHERE opens_at <= now() ORDER BY opens_at DESC LIMIT 1)
+    """)
+
+    op.drop_index('ix_quiz_participation_status', table_name='quiz_participation')
+    op.drop_table('quiz_participation')
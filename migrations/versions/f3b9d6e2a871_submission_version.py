@@ -0,0 +1,26 @@
+"""submission version
+
+Revision ID: f3b9d6e2a871
+Revises: e5a7c3d1f284
+Create Date: 2026-10-18 15:41:07.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9d6e2a871'
+down_revision = 'e5a7c3d1f284'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('quiz_submission', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('quiz_submission', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,107 @@
+"""Tests run against a real, disposable Postgres database named by TEST_DATABASE_URL.
+
+The schema is brought up with the alembic migrations; every test runs in a transaction that is
+rolled back, so nothing is committed. Without TEST_DATABASE_URL the tests are skipped.
+"""
+import os
+import random
+import uuid
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+MIGRATIONS = os.path.join(os.path.dirname(__file__), os.pardir, "migrations")
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from flask_migrate import upgrade
+    from app import create_app
+
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": TEST_DATABASE_URL,
+        "SCHEDULER_ENABLED": False,
+    })
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        yield app
+
+
+@pytest.fixture
+def session(app):
+    from app.extensions import db
+    yield db.session
+    db.session.rollback()
+    db.session.expunge_all()
+
+
+@pytest.fixture
+def make_user(session):
+    from app.models import User
+
+    def make(**fields):
+        tag = uuid.uuid4().hex[:12]
+        user = User(username=f"t_{tag}", password="x", email=f"t_{tag}@test.invalid", points=0, **fields)
+        session.add(user)
+        session.flush()
+        return user
+    return make
+
+
+# (difficulty, indexes of the correct options); the last question accepts two options
+QUESTIONS = [("easy", {0}), ("medium", {1}), ("hard", {2}), ("easy", {3}), ("hard", {0, 2})]
+
+
+@pytest.fixture
+def make_quiz(session):
+    from sqlalchemy import func
+    from app.models import Quiz, QuizOption, QuizQuestion
+
+    def make(opens_at=None, closes_at=None):
+        now = datetime.now(timezone.utc)
+        week = session.query(func.coalesce(func.max(Quiz.week_start_date), date.today())).scalar()
+        quiz = Quiz(
+            week_start_date=week + timedelta(days=7),
+            title="test quiz",
+            opens_at=opens_at or now - timedelta(hours=1),
+            closes_at=closes_at or now + timedelta(hours=1),
+            published_at=now - timedelta(hours=1),
+        )
+        for order, (difficulty, correct) in enumerate(QUESTIONS, start=1):
+            quiz.questions.append(QuizQuestion(
+                order=order, text=f"q{order}", difficulty=difficulty,
+                options=[QuizOption(text=f"o{k}", is_correct=k in correct) for k in range(4)],
+            ))
+        session.add(quiz)
+        session.flush()
+        return quiz
+    return make
+
+
+@pytest.fixture
+def random_answers():
+    rng = random.Random(20240601)
+
+    def make(quiz) -> dict:
+        """A draft's answers: blanks, cleared (null) answers and options of another question mixed in.
+
+        The first question is always answered, so no draft is empty.
+        """
+        every_option = [o.id for q in quiz.questions for o in q.options]
+        answers = {}
+        for i, q in enumerate(quiz.questions):
+            roll = rng.random()
+            if roll < 0.15 and i:
+                continue
+            if roll < 0.25 and i:
+                answers[str(q.id)] = None
+            elif roll < 0.35:
+                answers[str(q.id)] = rng.choice(every_option)
+            else:
+                answers[str(q.id)] = rng.choice(q.options).id
+        return answers
+    return make
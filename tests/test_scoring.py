@@ -0,0 +1,144 @@
+from __future__ import annotations
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.models import QuizParticipation, QuizSubmission, User
+from app.repos.participation_repo import ParticipationRepo
+from app.repos.quiz_repo import QuizRepo
+from app.repos.submission_repo import SubmissionRepo
+from app.services.answer_key import POINTS_BY_DIFF, AnswerKey
+from app.services.answer_matrix import key_vectors, load_matrix, score_matrix
+from app.services.quiz_service import day_bonus
+
+participation_repo = ParticipationRepo()
+quiz_repo = QuizRepo()
+submission_repo = SubmissionRepo()
+
+# a Wednesday, so the submit-day bonus is 4
+AT = datetime(2026, 3, 4, 12, 0, tzinfo=timezone.utc)
+
+
+def _answer_key(session, quiz_id: int) -> AnswerKey:
+    session.expire_all()
+    return AnswerKey.from_quiz(quiz_repo.get_with_question(quiz_id))
+
+
+def _draft(session, quiz, user, answers: dict, *, key: AnswerKey | None = None, joined: bool = True):
+    session.add(QuizSubmission(
+        quiz_id=quiz.id, user_id=user.id, answers=answers, answered_count=len(answers),
+        partial_score=key.score(answers) if key else 0,
+    ))
+    if joined:
+        session.add(QuizParticipation(quiz_id=quiz.id, user_id=user.id, status="joined"))
+    session.flush()
+
+
+def _scores(session, quiz_id: int) -> dict[int, tuple]:
+    rows = session.execute(text("""
+        SELECT user_id, partial_score, score, submitted_at FROM quiz_submission WHERE quiz_id = :quiz_id
+    """), {"quiz_id": quiz_id})
+    return {r.user_id: (r.partial_score, r.score, r.submitted_at) for r in rows}
+
+
+def _points(session, user_ids) -> dict[int, int]:
+    return dict(session.query(User.id, User.points).filter(User.id.in_(list(user_ids))).all())
+
+
+def test_answer_key_matrix_and_sql_scores_agree(session, make_quiz, make_user, random_answers):
+    quiz = make_quiz()
+    drafts = {}
+    for _ in range(200):
+        user = make_user()
+        drafts[user.id] = random_answers(quiz)
+        _draft(session, quiz, user, drafts[user.id])
+    key = _answer_key(session, quiz.id)
+    expected = {uid: key.score(answers) for uid, answers in drafts.items()}
+    assert len(set(expected.values())) > 3
+
+    question_ids = sorted(key.points)
+    matrix = load_matrix(quiz.id, question_ids, submitted_only=False, chunk_size=64)
+    vectorized = score_matrix(matrix, key_vectors(key, question_ids))
+    assert dict(zip(matrix.user_ids.tolist(), vectorized.tolist())) == expected
+
+    # finalize scores in SQL through SubmissionRepo._points_case and the LATERAL sum over the answers
+    _last_id, finalized, points = submission_repo.finalize_drafts_chunk(quiz.id, 0, 1000, AT, 0, POINTS_BY_DIFF)
+    assert finalized == len(drafts)
+    assert points == sum(expected.values())
+    assert {uid: s[0] for uid, s in _scores(session, quiz.id).items()} == expected
+
+
+def test_finalize_scores_like_a_manual_submit(session, make_quiz, make_user, random_answers):
+    quiz = make_quiz()
+    key = _answer_key(session, quiz.id)
+    answers = random_answers(quiz)
+    now = datetime.now(timezone.utc)
+    bonus = day_bonus(now)
+
+    submitted, drafted = make_user(), make_user()
+    timed_out, banned = make_user(timeout=True), make_user(user_status="banned")
+    for user in (submitted, drafted, timed_out, banned):
+        _draft(session, quiz, user, answers, key=key)
+
+    row = participation_repo.submit(quiz.id, submitted.id, now, bonus)
+    assert row is not None and row.score == key.score(answers) + bonus
+
+    _last_id, finalized, points = submission_repo.finalize_drafts_chunk(quiz.id, 0, 1000, now, bonus, POINTS_BY_DIFF)
+    assert (finalized, points) == (1, row.score)
+
+    scores = _scores(session, quiz.id)
+    assert scores[drafted.id] == scores[submitted.id]
+    assert scores[timed_out.id][2] is None and scores[banned.id][2] is None
+
+    statuses = dict(session.query(QuizParticipation.user_id, QuizParticipation.status)
+                    .filter(QuizParticipation.quiz_id == quiz.id).all())
+    assert statuses == {submitted.id: "submitted", drafted.id: "submitted",
+                        timed_out.id: "joined", banned.id: "joined"}
+    assert _points(session, statuses) == {submitted.id: row.score, drafted.id: row.score,
+                                          timed_out.id: 0, banned.id: 0}
+
+
+def test_finalize_is_safe_to_rerun(session, make_quiz, make_user, random_answers):
+    quiz = make_quiz(opens_at=AT - timedelta(days=1), closes_at=AT)
+    users = [make_user() for _ in range(5)]
+    for user in users:
+        _draft(session, quiz, user, random_answers(quiz))
+
+    after_id, total = 0, 0
+    while True:
+        last_id, finalized, _points_credited = submission_repo.finalize_drafts_chunk(
+            quiz.id, after_id, 2, AT, day_bonus(AT), POINTS_BY_DIFF)
+        if last_id is None:
+            break
+        after_id, total = last_id, total + finalized
+    assert total == len(users)
+    before = _points(session, [u.id for u in users])
+
+    assert submission_repo.finalize_drafts_chunk(quiz.id, 0, 1000, AT, day_bonus(AT), POINTS_BY_DIFF)[1:] == (0, 0)
+    assert _points(session, [u.id for u in users]) == before
+
+
+def test_rescore_credits_the_score_delta(session, make_quiz, make_user, random_answers):
+    quiz = make_quiz(opens_at=AT - timedelta(days=1), closes_at=AT)
+    drafts = {}
+    for _ in range(50):
+        user = make_user()
+        drafts[user.id] = random_answers(quiz)
+        _draft(session, quiz, user, drafts[user.id])
+    submission_repo.finalize_drafts_chunk(quiz.id, 0, 1000, AT, day_bonus(AT), POINTS_BY_DIFF)
+    before = _scores(session, quiz.id)
+
+    # the first question's correct answer moves from its first option to its second
+    for k, option in enumerate(sorted(quiz.questions[0].options, key=lambda o: o.id)):
+        option.is_correct = k == 1
+    session.flush()
+    key = _answer_key(session, quiz.id)
+
+    rescored, points_delta = submission_repo.rescore_quiz(quiz.id, POINTS_BY_DIFF)
+    after = _scores(session, quiz.id)
+    for uid, answers in drafts.items():
+        assert after[uid][:2] == (key.score(answers), key.score(answers) + day_bonus(AT))
+    deltas = {uid: after[uid][1] - before[uid][1] for uid in drafts}
+    assert rescored == sum(1 for d in deltas.values() if d)
+    assert points_delta == sum(deltas.values())
+    assert _points(session, drafts) == {uid: after[uid][1] for uid in drafts}